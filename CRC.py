@@ -1,81 +1,440 @@
-s="10011101"
-b="1011"
-a=s
-a=a+3*'0'
-print(a)
-
-while True:
-    c=len(a)-len(b)
-    if len(b) < len(a):
-        b=b+c*'0'
-    print(b)
-    print(len(a)*'-')
-    y=int(a,2) ^ int(b,2)
-    if len(b) >= len(a):
-        b=b.rstrip('0')
-    a=format(y,'b')
-    print(a)
-    if len(a) <= 3:
-        break
-
-if len(a) < 3:
-    e=3-len(a)
-    z=e*'0'+a
-else:
-    z=a
-
-print("z je:",z)
-v=s+z
-print("v je:",v)
-ch='10011101011'
-print("ch je:",ch)
-
-while True:
-    c=len(ch)-len(b)
-    if len(b) < len(ch):
-        b=b+c*'0'
-    print(b)
-    print(len(ch)*'-')
-    y=int(ch,2) ^ int(b,2)
-    if len(b) >= len(ch):
-        b=b.rstrip('0')
-    ch=format(y,'b')
-    print(ch)
-    if len(ch) <= 3:
-        break
-
-print('Tady zaciname:')
-i=len(b)-1
-h='1'+i*'0'
-
-while True:
-    # if ch == '100':
-    #     print('na pozici 3 byla chyba')
-    #     break
-    # elif ch == '10':
-    #     print('na pozici 2 byla chyba')
-    #     break
-    # elif ch == '1':
-    #     print('na pozici 1 byla chyba')
-    #     break
-    print(h)
-    c=len(h)-len(b)
-    if len(b) < len(h):
-        b=b+c*'0'
-    print(b)
-    print(len(h)*'-')
-    y=int(h,2) ^ int(b,2)
-    if len(b) >= len(h):
-        b=b.rstrip('0')
-    h=format(y,'b')
-    print(h)
-    if h == ch:
-        print('na pozici {} byla chyba'.format(i+1))
-        break
-    if i == len(v)-1:
+import argparse
+import mmap
+import os
+import sys
+import time
+import zlib
+import numpy as np
+
+# Parameters (width, poly, init, refin, refout, xorout) of a few commonly used CRCs
+MODELS = {
+    'crc-3': (3, 0x3, 0x0, False, False, 0x0),
+    'crc-8': (8, 0x07, 0x00, False, False, 0x00),
+    'crc-16/ccitt-false': (16, 0x1021, 0xFFFF, False, False, 0x0000),
+    'crc-16/modbus': (16, 0x8005, 0xFFFF, True, True, 0x0000),
+    'crc-32': (32, 0x04C11DB7, 0xFFFFFFFF, True, True, 0xFFFFFFFF),
+    'crc-32c': (32, 0x1EDC6F41, 0xFFFFFFFF, True, True, 0xFFFFFFFF),
+    'crc-64/xz': (64, 0x42F0E1EBA9EA3693, 0xFFFFFFFFFFFFFFFF, True, True, 0xFFFFFFFFFFFFFFFF),
+}
+
+# Reverse the order of the lowest `width` bits of a number
+def reflect(value, width):
+    result = 0
+    for _ in range(width):
+        result = (result << 1) | (value & 1)
+        value >>= 1
+    return result
+
+# Table driven CRC for an arbitrary generator polynomial
+class CrcEngine:
+    def __init__(self, poly, width, init=0, refin=False, refout=None, xorout=0):
+        if width < 1:
+            raise ValueError('width must be at least 1')
+        if refout is None:
+            refout = refin
+        self.width = width
+        self.poly = poly & ((1 << width) - 1)
+        self.init = init
+        self.refin = refin
+        self.refout = refout
+        self.xorout = xorout
+        # Non reflected registers narrower than a byte are kept left aligned in 8 bits
+        self._bits = width if refin else max(width, 8)
+        self._mask = (1 << self._bits) - 1
+        self._tables = self._make_tables()
+        self._table = self._tables[0]
+        # zlib already implements CRC-32 in C
+        self._zlib = (width, self.poly, init, refin, refout, xorout) == MODELS['crc-32']
+
+    # Engine from a generator written as a bit string, e.g. "1011" for x^3 + x + 1
+    @classmethod
+    def from_generator(cls, generator, **kwargs):
+        generator = generator.lstrip('0')
+        if len(generator) < 2:
+            raise ValueError('generator must have degree of at least 1')
+        return cls(int(generator, 2), len(generator) - 1, **kwargs)
+
+    # Engine for one of the named models in MODELS
+    @classmethod
+    def from_model(cls, name):
+        width, poly, init, refin, refout, xorout = MODELS[name.lower()]
+        return cls(poly, width, init, refin, refout, xorout)
+
+    # Byte wise table plus the seven extra tables used by slice-by-8
+    def _make_tables(self):
+        table = []
+        if self.refin:
+            poly = reflect(self.poly, self.width)
+            for i in range(256):
+                reg = i
+                for _ in range(8):
+                    reg = (reg >> 1) ^ poly if reg & 1 else reg >> 1
+                table.append(reg)
+        else:
+            poly = self.poly << (self._bits - self.width)
+            top = 1 << (self._bits - 1)
+            for i in range(256):
+                reg = i << (self._bits - 8)
+                for _ in range(8):
+                    reg = ((reg << 1) ^ poly if reg & top else reg << 1) & self._mask
+                table.append(reg)
+        tables = [table]
+        if self._bits <= 64:
+            # tables[k][i] is the register after byte i followed by k zero bytes
+            shift = self._bits - 8
+            for _ in range(7):
+                previous = tables[-1]
+                if self.refin:
+                    tables.append([table[r & 0xFF] ^ (r >> 8) for r in previous])
+                else:
+                    tables.append([table[r >> shift] ^ ((r << 8) & self._mask) for r in previous])
+        return tables
+
+    # Register value before any data was processed
+    def _start(self):
+        if self.refin:
+            return reflect(self.init, self.width)
+        return self.init << (self._bits - self.width)
+
+    # Final CRC value of a register
+    def _finish(self, reg):
+        if not self.refin:
+            reg >>= self._bits - self.width
+        if self.refin != self.refout:
+            reg = reflect(reg, self.width)
+        return reg ^ self.xorout
+
+    # Feed bytes into a register
+    def _update(self, reg, data):
+        data = memoryview(data).cast('B')
+        if self._zlib:
+            return zlib.crc32(data, reg ^ 0xFFFFFFFF) ^ 0xFFFFFFFF
+        n = 0
+        if len(self._tables) == 8:
+            n = len(data) & ~7
+            reg = self._update_slice8(reg, data[:n])
+        table = self._table
+        if self.refin:
+            for byte in data[n:]:
+                reg = table[(reg ^ byte) & 0xFF] ^ (reg >> 8)
+        else:
+            shift = self._bits - 8
+            mask = self._mask
+            for byte in data[n:]:
+                reg = table[(reg >> shift) ^ byte] ^ ((reg << 8) & mask)
+        return reg
+
+    # Process eight bytes per step, the register has to fit into 64 bits
+    def _update_slice8(self, reg, data):
+        t0, t1, t2, t3, t4, t5, t6, t7 = self._tables
+        from_bytes = int.from_bytes
+        if self.refin:
+            for i in range(0, len(data), 8):
+                v = reg ^ from_bytes(data[i:i + 8], 'little')
+                reg = (t7[v & 0xFF] ^ t6[(v >> 8) & 0xFF] ^ t5[(v >> 16) & 0xFF] ^ t4[(v >> 24) & 0xFF] ^
+                       t3[(v >> 32) & 0xFF] ^ t2[(v >> 40) & 0xFF] ^ t1[(v >> 48) & 0xFF] ^ t0[v >> 56])
+        else:
+            shift = 64 - self._bits
+            for i in range(0, len(data), 8):
+                v = (reg << shift) ^ from_bytes(data[i:i + 8], 'big')
+                reg = (t7[v >> 56] ^ t6[(v >> 48) & 0xFF] ^ t5[(v >> 40) & 0xFF] ^ t4[(v >> 32) & 0xFF] ^
+                       t3[(v >> 24) & 0xFF] ^ t2[(v >> 16) & 0xFF] ^ t1[(v >> 8) & 0xFF] ^ t0[v & 0xFF])
+        return reg
+
+    # Feed single bits (most significant first) into a register
+    def _update_bits(self, reg, value, nbits):
+        if self.refin:
+            raise ValueError('bit strings are only supported by non reflected CRCs')
+        poly = self.poly << (self._bits - self.width)
+        top = self._bits - 1
+        for k in range(nbits - 1, -1, -1):
+            if ((reg >> top) ^ (value >> k)) & 1:
+                reg = ((reg << 1) ^ poly) & self._mask
+            else:
+                reg = (reg << 1) & self._mask
+        return reg
+
+    # CRC of bytes-like data
+    def compute(self, data):
+        return self._finish(self._update(self._start(), data))
+
+    # CRC of a message written as a bit string, e.g. "10011101"
+    def compute_bits(self, bits):
+        head = len(bits) % 8
+        reg = self._update_bits(self._start(), int(bits[:head] or '0', 2), head)
+        if len(bits) > head:
+            reg = self._update(reg, int(bits[head:], 2).to_bytes((len(bits) - head) // 8, 'big'))
+        return self._finish(reg)
+
+# Syndrome -> bit position table for one CRC and one codeword length (message followed by its CRC).
+# Positions are counted from the last transmitted bit, starting at 0.
+class ErrorLocator:
+    def __init__(self, engine, length):
+        if engine.refin != engine.refout:
+            raise ValueError('error location needs refin == refout')
+        self.engine = engine
+        self.length = length
+        self.table = {}
+        # Longer codewords than the period of the generator share syndromes, like the original
+        # brute force search the lowest matching position is reported
+        self.unique = True
+        generator = (1 << engine.width) | engine.poly
+        syndrome = 1
+        for position in range(length):
+            key = reflect(syndrome, engine.width) if engine.refin else syndrome
+            if key in self.table:
+                self.unique = False
+            else:
+                self.table[key] = position
+            syndrome <<= 1
+            if syndrome >> engine.width:
+                syndrome ^= generator
+
+    # Syndrome of a received codeword given as a bit string or as bytes, 0 means no error
+    def syndrome(self, codeword):
+        engine = self.engine
+        if isinstance(codeword, str):
+            message, check = codeword[:-engine.width], int(codeword[-engine.width:], 2)
+            return engine.compute_bits(message) ^ check
+        if engine.width % 8:
+            raise ValueError('byte codewords need a CRC width divisible by 8')
+        size = engine.width // 8
+        codeword = memoryview(codeword).cast('B')
+        check = int.from_bytes(codeword[-size:], 'little' if engine.refout else 'big')
+        return engine.compute(codeword[:-size]) ^ check
+
+    def verify(self, codeword):
+        return self.syndrome(codeword) == 0
+
+    # None for a valid codeword, the position of a single bit error, or -1 if no single bit error fits
+    def locate(self, codeword):
+        syndrome = self.syndrome(codeword)
+        if syndrome == 0:
+            return None
+        return self.table.get(syndrome, -1)
+
+    # Positions for many received codewords
+    def locate_many(self, codewords):
+        return [self.locate(codeword) for codeword in codewords]
+
+    # Copy of the codeword with a located single bit error flipped back
+    def correct(self, codeword):
+        position = self.locate(codeword)
+        if position is None:
+            return codeword
+        if position < 0:
+            raise ValueError('error can not be corrected')
+        if isinstance(codeword, str):
+            i = len(codeword) - 1 - position
+            return codeword[:i] + ('1' if codeword[i] == '0' else '0') + codeword[i + 1:]
+        fixed = bytearray(codeword)
+        # Reflected CRCs send every byte least significant bit first
+        mask = 0x80 >> (position % 8) if self.engine.refin else 1 << (position % 8)
+        fixed[len(fixed) - 1 - position // 8] ^= mask
+        return bytes(fixed)
+
+# Smallest unsigned NumPy type that holds a register of the engine
+def _register_dtype(engine):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if engine._bits <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError('batch CRC supports widths up to 64 bits')
+
+# CRC of every row of a 2-D uint8 array, one table lookup per column for all rows at once
+def crc_frames(engine, frames):
+    frames = np.asarray(frames, dtype=np.uint8)
+    if frames.ndim != 2:
+        raise ValueError('frames must be a 2-D array with one frame per row')
+    dtype = _register_dtype(engine)
+    table = np.array(engine._table, dtype=dtype)
+    reg = np.full(len(frames), engine._start(), dtype=dtype)
+    # Columns are walked one after another, so make them contiguous
+    columns = np.ascontiguousarray(frames.T, dtype=dtype)
+    eight = dtype(8)
+    if engine.refin:
+        for column in columns:
+            reg = table[(reg ^ column) & dtype(0xFF)] ^ (reg >> eight)
+    else:
+        shift = dtype(engine._bits - 8)
+        mask = dtype(engine._mask)
+        for column in columns:
+            reg = table[(reg >> shift) ^ column] ^ ((reg << eight) & mask)
+        reg >>= dtype(engine._bits - engine.width)
+    if engine.refin != engine.refout:
+        reflected = np.zeros_like(reg)
+        for k in range(engine.width):
+            reflected |= ((reg >> dtype(k)) & dtype(1)) << dtype(engine.width - 1 - k)
+        reg = reflected
+    return reg ^ dtype(engine.xorout)
+
+# Pass/fail flag for every row of a 2-D uint8 array whose last bytes hold the CRC of the rest
+def verify_frames(engine, frames):
+    if engine.width % 8:
+        raise ValueError('byte frames need a CRC width divisible by 8')
+    frames = np.asarray(frames, dtype=np.uint8)
+    size = engine.width // 8
+    dtype = _register_dtype(engine)
+    check = np.zeros(len(frames), dtype=dtype)
+    columns = range(size - 1, -1, -1) if engine.refout else range(size)
+    for k in columns:
+        check = (check << dtype(8)) | frames[:, frames.shape[1] - size + k].astype(dtype)
+    return crc_frames(engine, frames[:, :-size]) == check
+
+# Incremental CRC with the same interface as the hashlib objects
+class CrcHash:
+    def __init__(self, engine, data=None):
+        self.engine = engine
+        self.name = 'crc-{}'.format(engine.width)
+        self.digest_size = (engine.width + 7) // 8
+        self.block_size = 1
+        self._reg = engine._start()
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        self._reg = self.engine._update(self._reg, data)
+
+    # Current CRC as a number
+    @property
+    def crcvalue(self):
+        return self.engine._finish(self._reg)
+
+    def digest(self):
+        return self.crcvalue.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    def copy(self):
+        other = CrcHash.__new__(CrcHash)
+        other.__dict__.update(self.__dict__)
+        return other
+
+# CRC of a file read through one reused buffer (or a memory map), so memory use does not depend on the file size
+def crc_file(path, engine, chunk_size=1 << 20, use_mmap=False):
+    crc = CrcHash(engine)
+    with open(path, 'rb') as f:
+        if use_mmap:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    view = memoryview(m)
+                    try:
+                        for i in range(0, size, chunk_size):
+                            crc.update(view[i:i + chunk_size])
+                    finally:
+                        view.release()
+        else:
+            buffer = bytearray(chunk_size)
+            view = memoryview(buffer)
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                crc.update(view[:n])
+    return crc
+
+# Remainder by the original string long division (kept for the benchmark)
+def long_division(s, b):
+    width = len(b) - 1
+    a = s + width * '0'
+    while True:
+        c = len(a) - len(b)
+        if len(b) < len(a):
+            b = b + c * '0'
+        y = int(a, 2) ^ int(b, 2)
+        if len(b) >= len(a):
+            b = b.rstrip('0')
+        a = format(y, 'b')
+        if len(a) <= width:
+            break
+    return int(a, 2)
+
+# Compare the vectorized batch CRC with one frame at a time loops
+def benchmark(engine, count=10 ** 6, frame_size=16, sample=2000):
+    frames = np.random.default_rng(0).integers(0, 256, size=(count, frame_size), dtype=np.uint8)
+    generator = '1' + format(engine.poly, '0{}b'.format(engine.width))
+    plain = CrcEngine(engine.poly, engine.width)
+    sample = min(sample, count)
+
+    t0 = time.perf_counter()
+    batch = crc_frames(plain, frames)
+    t_batch = time.perf_counter() - t0
+
+    bits = [''.join(format(byte, '08b') for byte in frame) for frame in frames[:sample].tolist()]
+    t0 = time.perf_counter()
+    legacy = [long_division(s, generator) for s in bits]
+    t_legacy = (time.perf_counter() - t0) * count / sample
+
+    rows = [frame.tobytes() for frame in frames[:sample]]
+    t0 = time.perf_counter()
+    single = [plain.compute(row) for row in rows]
+    t_single = (time.perf_counter() - t0) * count / sample
+
+    if legacy != single or single != batch[:sample].tolist():
+        raise AssertionError('batch CRC does not match the long division')
+    print('{} frames of {} bytes, crc-{}'.format(count, frame_size, engine.width))
+    print('{:<24}{:10.3f} s (estimated from {} frames)'.format('string long division:', t_legacy, sample))
+    print('{:<24}{:10.3f} s (estimated from {} frames)'.format('table engine per frame:', t_single, sample))
+    print('{:<24}{:10.3f} s ({:.0f} frames/s)'.format('vectorized batch:', t_batch, count / t_batch))
+
+# The original example with the 1011 generator
+def demo():
+    s="10011101"
+    b="1011"
+    crc = CrcEngine.from_generator(b)
+    print(s+(len(b)-1)*'0')
+
+    z=format(crc.compute_bits(s), '0{}b'.format(crc.width))
+    print("z je:",z)
+    v=s+z
+    print("v je:",v)
+    ch='10011101011'
+    print("ch je:",ch)
+    locator = ErrorLocator(crc, len(v))
+    print(format(locator.syndrome(ch), 'b'))
+
+    print('Tady zaciname:')
+    i = locator.locate(ch)
+    if i is None:
         print('prenos bez chyby')
-        break
-    if len(h) <= 3:
-        i += 1
-        h='1'+i*'0'
+    elif i < 0:
+        print('chybu nelze urcit')
+    else:
+        print('na pozici {} byla chyba'.format(i+1))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cyclic Redundancy Check of files. Without files the 1011 example is shown.')
+    parser.add_argument('files', nargs='*', help='files to checksum')
+    parser.add_argument('-m', '--model', default='crc-32', choices=sorted(MODELS), help='CRC model (default crc-32)')
+    parser.add_argument('-g', '--generator', help='generator as a bit string, e.g. 1011 (overrides --model)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=1 << 20, help='read buffer size in bytes')
+    parser.add_argument('--mmap', action='store_true', help='memory map the files instead of reading them')
+    parser.add_argument('--bench', type=int, metavar='FRAMES', help='benchmark the batch CRC over this many random frames')
+    parser.add_argument('--frame-size', type=int, default=16, help='frame size in bytes for --bench')
+    args = parser.parse_args(argv)
+
+    if args.generator:
+        engine = CrcEngine.from_generator(args.generator)
+    else:
+        engine = CrcEngine.from_model(args.model)
+    if args.bench:
+        benchmark(engine, args.bench, args.frame_size)
+        return 0
+    if not args.files:
+        demo()
+        return 0
+    status = 0
+    for path in args.files:
+        try:
+            crc = crc_file(path, engine, args.chunk_size, args.mmap)
+        except OSError as e:
+            print('{}: {}'.format(path, e.strerror), file=sys.stderr)
+            status = 1
+            continue
+        print('{}  {}'.format(crc.hexdigest(), path))
+    return status
+
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,55 +1,408 @@
+import argparse
+import io
 import math
+import os
+import tempfile
 import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits import mplot3d
 
-prime_n=[]
+# Odd numbers per segment, one byte each, so a segment fits into a typical 1 MiB L2 cache
+SEGMENT_SIZE = 1 << 20
+# Below this limit the process pool costs more than it saves
+PARALLEL_THRESHOLD = 10 ** 7
+# Upper bound of segments per task, keeps the prime arrays sent back small
+MAX_TASK_SEGMENTS = 64
+# File used by the script to keep sieved primes between runs
+CACHE_FILE = 'primes.cache'
+# Render modes of the spiral, 'auto' falls back from the plain scatter above SCATTER_LIMIT points
+RENDER_MODES = ('auto', 'scatter', 'decimate', 'density')
+SCATTER_LIMIT = 100000
 
-def Sieve(n):
-    prime = [True for i in range(n+1)]
-    p = 2
-    while(p * p <= n):
-        if (prime[p] == True):
-            for i in range(p * p, n + 1, p):
-                prime[i] = False
-        p += 1
-    c = 0
- 
-    for p in range(2, n):
-        if prime[p]:
-            prime_n.append(p)
-            c += 1
+# Primes up to and including n with a plain odd-only sieve, used for the base primes
+def small_primes(n):
+    if n < 2:
+        return np.zeros(0, dtype=np.int64)
+    odd = np.ones((n + 1) // 2, dtype=bool)
+    odd[0] = False
+    for i in range(1, (math.isqrt(n) + 1) // 2):
+        if odd[i]:
+            p = 2 * i + 1
+            odd[p * p // 2::p] = False
+    return np.concatenate(([2], 2 * np.flatnonzero(odd) + 1)).astype(np.int64)
+
+# Sieve the odd numbers in [lo, hi) (lo odd) with the given odd base primes, True marks a prime
+def sieve_segment(lo, hi, base, buffer=None):
+    size = (hi - lo + 1) // 2
+    if buffer is None:
+        segment = np.ones(size, dtype=bool)
+    else:
+        segment = buffer[:size]
+        segment[:] = True
+    for p in base.tolist():
+        if p * p >= hi:
+            break
+        start = max(p * p, (lo + p - 1) // p * p)
+        if start % 2 == 0:
+            start += p
+        segment[(start - lo) // 2::p] = False
+    if lo == 1 and size:
+        segment[0] = False
+    return segment
+
+# Segmented sieve yielding NumPy arrays with the primes below n, segment by segment.
+# Memory is O(sqrt(n) + segment_size).
+def segmented_sieve(n, segment_size=SEGMENT_SIZE):
+    if n <= 2:
+        return
+    yield np.array([2], dtype=np.int64)
+    base = small_primes(math.isqrt(n - 1))[1:]
+    buffer = np.empty(segment_size, dtype=bool)
+    for lo in range(1, n, 2 * segment_size):
+        hi = min(lo + 2 * segment_size, n)
+        segment = sieve_segment(lo, hi, base, buffer)
+        yield lo + 2 * np.flatnonzero(segment)
+
+# All primes below n as one NumPy array
+def primes(n, segment_size=SEGMENT_SIZE):
+    chunks = list(segmented_sieve(n, segment_size))
+    if not chunks:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(chunks)
+
+# Primes below n one at a time
+def iter_primes(n, segment_size=SEGMENT_SIZE):
+    for chunk in segmented_sieve(n, segment_size):
+        yield from chunk.tolist()
+
+# Number of primes below n, the primes themselves are never collected
+def Sieve(n, segment_size=SEGMENT_SIZE):
+    if n <= 2:
+        return 0
+    base = small_primes(math.isqrt(n - 1))[1:]
+    buffer = np.empty(segment_size, dtype=bool)
+    c = 1
+    for lo in range(1, n, 2 * segment_size):
+        hi = min(lo + 2 * segment_size, n)
+        c += int(np.count_nonzero(sieve_segment(lo, hi, base, buffer)))
     return c
 
-print("Input number of natural numbers:")
-amount = int(input())
-t0 = time.time()
-c = Sieve(amount)
-print("Total prime numbers in range:", c)
-t1 = time.time()
-print("Time required:", t1 - t0)
-
-d = [0 for i in range(len(prime_n))]
-print("Input number which will shape our graph (2;10):")
-w = int(input())
-i= 0
-while i < len(d)//w:
-    for j in range(0, len(prime_n)//w):  
-        d[i] = 0.001 * prime_n[j] - 0.001 * prime_n[len(prime_n)//w]
-        i += 1
-
-def get_coordinate(num):
+# Base primes of a worker process, sent once when the worker starts
+_worker_base = None
+
+def _init_worker(base):
+    global _worker_base
+    _worker_base = base
+
+# Sieve the odd numbers in [lo, hi) segment by segment inside a worker
+def _sieve_block(lo, hi, segment_size, count_only):
+    buffer = np.empty(segment_size, dtype=bool)
+    c = 0
+    chunks = []
+    for start in range(lo, hi, 2 * segment_size):
+        segment = sieve_segment(start, min(start + 2 * segment_size, hi), _worker_base, buffer)
+        if count_only:
+            c += int(np.count_nonzero(segment))
+        else:
+            chunks.append(start + 2 * np.flatnonzero(segment))
+    if count_only:
+        return c
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+# Tasks (lo, hi) covering the odd numbers in [lo, hi) (lo odd) in runs of whole segments
+def _task_bounds(lo, hi, workers, segment_size):
+    segments = -(-(hi - lo) // (2 * segment_size))
+    # A few tasks per worker so that faster workers pick up more of them
+    per_task = min(MAX_TASK_SEGMENTS, max(1, segments // (4 * workers)))
+    span = 2 * segment_size * per_task
+    return [(start, min(start + span, hi)) for start in range(lo, hi, span)]
+
+# Sieve below n on a process pool. The base primes are sieved once and every worker gets
+# disjoint runs of segments. Returns the number of primes if count_only, otherwise the primes in order.
+def parallel_sieve(n, workers=None, count_only=False, segment_size=SEGMENT_SIZE):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or n <= 2 or n < PARALLEL_THRESHOLD:
+        return Sieve(n, segment_size) if count_only else primes(n, segment_size)
+    base = small_primes(math.isqrt(n - 1))[1:]
+    bounds = _task_bounds(1, n, workers, segment_size)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(base,)) as pool:
+        results = pool.map(_sieve_block, *zip(*bounds), [segment_size] * len(bounds), [count_only] * len(bounds))
+        if count_only:
+            return 1 + int(sum(results))
+        return np.concatenate([np.array([2], dtype=np.int64)] + list(results))
+
+# Number of set bits in every byte of a uint8 array
+def _popcount(data):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(data)
+    return _POPCOUNT_TABLE[data]
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Sieved primes kept on disk as a bitset of the odd numbers (bit i is 2i+1, little bit order)
+# after a 16 byte header with a magic and the covered limit. The file is memory-mapped and
+# only the missing part of a range is sieved and appended, on a process pool of `workers`
+# (default all cores) when it spans at least PARALLEL_THRESHOLD numbers.
+class PrimeCache:
+    MAGIC = b'PRIMES\x00\x01'
+    HEADER = 16
+    # Bytes per block of the prefix count index
+    BLOCK = 4096
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE, workers=None):
+        if segment_size % 8:
+            raise ValueError('segment_size must be a multiple of 8')
+        self.path = path
+        self.segment_size = segment_size
+        self.workers = workers or os.cpu_count() or 1
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(self.MAGIC + (0).to_bytes(8, 'little'))
+        with open(path, 'rb') as f:
+            header = f.read(self.HEADER)
+        if len(header) != self.HEADER or header[:8] != self.MAGIC:
+            raise ValueError('{} is not a prime cache file'.format(path))
+        self.limit = int.from_bytes(header[8:], 'little')
+        self._open()
+
+    # Map the bitset and rebuild the prefix counts of its blocks
+    def _open(self):
+        size = self.limit // 16
+        if size:
+            self.bits = np.memmap(self.path, dtype=np.uint8, mode='r', offset=self.HEADER, shape=(size,))
+        else:
+            self.bits = np.zeros(0, dtype=np.uint8)
+        counts = [np.zeros(1, dtype=np.int64)]
+        step = 256 * self.BLOCK
+        for start in range(0, size, step):
+            chunk = np.asarray(self.bits[start:start + step])
+            blocks = -(-len(chunk) // self.BLOCK)
+            padded = np.zeros(blocks * self.BLOCK, dtype=np.uint8)
+            padded[:len(chunk)] = chunk
+            counts.append(_popcount(padded).reshape(blocks, self.BLOCK).sum(axis=1, dtype=np.int64))
+        self._block_counts = np.cumsum(np.concatenate(counts))
+
+    def close(self):
+        self.bits = None
+
+    # Make sure every number below n is in the cache
+    def extend(self, n):
+        if n <= self.limit:
+            return
+        new_limit = -(-n // 16) * 16
+        base = small_primes(math.isqrt(new_limit - 1))[1:]
+        # Drop the mapping before the file grows
+        self.close()
+        with open(self.path, 'r+b') as f:
+            f.seek(self.HEADER + self.limit // 16)
+            if self.workers == 1 or new_limit - self.limit < PARALLEL_THRESHOLD:
+                buffer = np.empty(self.segment_size, dtype=bool)
+                for lo in range(self.limit + 1, new_limit, 2 * self.segment_size):
+                    hi = min(lo + 2 * self.segment_size, new_limit)
+                    segment = sieve_segment(lo, hi, base, buffer)
+                    f.write(np.packbits(segment, bitorder='little').tobytes())
+            else:
+                # Both ends are multiples of 16 and tasks are whole segments, so every block packs to whole bytes
+                bounds = _task_bounds(self.limit + 1, new_limit, self.workers, self.segment_size)
+                with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(base,)) as pool:
+                    blocks = pool.map(_sieve_block, *zip(*bounds), [self.segment_size] * len(bounds),
+                                      [False] * len(bounds))
+                    for (lo, hi), found in zip(bounds, blocks):
+                        segment = np.zeros((hi - lo + 1) // 2, dtype=bool)
+                        segment[(found - lo) // 2] = True
+                        f.write(np.packbits(segment, bitorder='little').tobytes())
+            f.seek(8)
+            f.write(new_limit.to_bytes(8, 'little'))
+        self.limit = new_limit
+        self._open()
+
+    # Number of odd primes among the first m odd numbers
+    def _count_odd(self, m):
+        full = m // 8
+        block = full // self.BLOCK
+        c = int(self._block_counts[block])
+        c += int(_popcount(np.asarray(self.bits[block * self.BLOCK:full])).sum())
+        if m % 8:
+            c += bin(int(self.bits[full]) & ((1 << (m % 8)) - 1)).count('1')
+        return c
+
+    # Number of primes less than or equal to n
+    def pi(self, n):
+        if n < 2:
+            return 0
+        self.extend(n + 1)
+        return 1 + self._count_odd((n + 1) // 2)
+
+    def is_prime(self, k):
+        if k < 3:
+            return k == 2
+        if k % 2 == 0:
+            return False
+        self.extend(k + 1)
+        i = k // 2
+        return bool((int(self.bits[i >> 3]) >> (i & 7)) & 1)
+
+    # Primes p with a <= p < b as a NumPy array
+    def primes_in(self, a, b):
+        a = max(a, 0)
+        if b <= a:
+            return np.zeros(0, dtype=np.int64)
+        self.extend(b)
+        first, last = a // 2, b // 2
+        chunk = np.unpackbits(np.asarray(self.bits[first // 8:-(-last // 8)]), bitorder='little')
+        found = 2 * (first + np.flatnonzero(chunk[first % 8:first % 8 + last - first])) + 1
+        if a <= 2 < b:
+            found = np.concatenate(([2], found))
+        return found.astype(np.int64)
+
+# The serial and the parallel path of PrimeCache.extend must write the same file, also when the range
+# ends right after a prime. Raises AssertionError on a difference, also under python -O.
+def check_cache(workers=2):
+    candidates = primes(PARALLEL_THRESHOLD + 10 ** 4)
+    # The cache covers multiples of 16, so its last odd number is one below such a multiple
+    last = int(candidates[(candidates >= PARALLEL_THRESHOLD) & (candidates % 16 == 15)][0])
+    expected = len(candidates[candidates <= last])
+    files = []
+    with tempfile.TemporaryDirectory() as directory:
+        for w in (1, workers):
+            path = os.path.join(directory, '{}.cache'.format(w))
+            cache = PrimeCache(path, workers=w)
+            if cache.pi(last) != expected or not cache.is_prime(last):
+                raise AssertionError('wrong cache with {} workers up to {}'.format(w, last))
+            cache.close()
+            with open(path, 'rb') as f:
+                files.append(f.read())
+    if files[0] != files[1]:
+        raise AssertionError('serial and parallel cache files differ up to {}'.format(last))
+    print('cache up to {} agrees on 1 and {} workers'.format(last, workers))
+
+# z offsets of the spiral: the first len(prime_n)//w primes are shifted relative to the prime right after them,
+# the rest stay at 0
+def spiral_offsets(prime_n, w):
+    prime_n = np.asarray(prime_n)
+    m = len(prime_n) // w
+    d = np.zeros(len(prime_n))
+    if len(prime_n):
+        if m >= len(prime_n):
+            raise ValueError('w must be at least 2')
+        d[:m] = 0.001 * prime_n[:m] - 0.001 * prime_n[m]
+    return d
+
+def get_coordinate(num, d):
     return num * np.cos(num), num * np.sin(num), d
 
-prime_n = np.array(list(prime_n))
-x, y, z = get_coordinate(prime_n)
+# Bin the points on a resolution x resolution grid over the x-y extent of the spiral.
+# Returns the flat cell index of every point and the number of cells per side.
+def _grid_cells(x, y, resolution):
+    def scale(v):
+        low, high = v.min(), v.max()
+        span = high - low if high > low else 1
+        return np.minimum(((v - low) / span * resolution).astype(np.int64), resolution - 1)
+    return scale(x) * resolution + scale(y)
+
+# One point per occupied grid cell at the mean position of its points, plus the number of points in the cell.
+# The result never has more than resolution ** 2 points.
+def decimate(x, y, z, resolution=200):
+    if len(x) == 0:
+        return x, y, z, np.zeros(0, dtype=np.int64)
+    cells = _grid_cells(x, y, resolution)
+    counts = np.bincount(cells, minlength=resolution * resolution)
+    occupied = np.flatnonzero(counts)
+    n = counts[occupied]
+    mean = lambda v: np.bincount(cells, weights=v, minlength=resolution * resolution)[occupied] / n
+    return mean(x), mean(y), mean(z), n
+
+# Number of points per cell of a resolution x resolution grid (rows follow y)
+def density_grid(x, y, resolution=800):
+    if len(x) == 0:
+        return np.zeros((resolution, resolution), dtype=np.int64)
+    cells = _grid_cells(x, y, resolution)
+    return np.bincount(cells, minlength=resolution * resolution).reshape(resolution, resolution).T
+
+# Draw the spiral. With an output path the figure is written as a PNG on the Agg backend and
+# no window is opened.
+def render(x, y, z, mode='auto', output=None, resolution=None, dpi=100):
+    if mode == 'auto':
+        mode = 'scatter' if len(x) <= SCATTER_LIMIT else 'decimate'
+    if output is not None:
+        plt.switch_backend('Agg')
+    plt.style.use('dark_background')
+    fig = plt.figure(figsize=(8, 8), dpi=dpi)
+    if mode == 'density':
+        # One cell per screen pixel
+        grid = np.log1p(density_grid(x, y, resolution or int(8 * dpi)))
+        # Clip the dense centre so the outer arms stay visible
+        vmax = np.percentile(grid[grid > 0], 99) if grid.any() else 1
+        ax = plt.axes([0, 0, 1, 1])
+        ax.imshow(grid, origin='lower', cmap='inferno', interpolation='nearest', vmax=vmax)
+    elif mode == 'decimate':
+        x, y, z, n = decimate(x, y, z, resolution or 200)
+        ax = plt.axes(projection ='3d')
+        ax.scatter(x, y, z, s=1, c=np.log1p(n), cmap='cool')
+    elif mode == 'scatter':
+        ax = plt.axes(projection ='3d')
+        ax.scatter(x, y, z, s=1)
+    else:
+        raise ValueError('unknown render mode {!r}'.format(mode))
+    plt.axis("off")
+    if output is None:
+        plt.show()
+    else:
+        fig.savefig(output)
+        plt.close(fig)
+    return fig
+
+# Render time and peak Python heap (tracemalloc, includes NumPy buffers) against point count, drawn headless
+def benchmark_render(counts=(10 ** 4, 10 ** 5, 10 ** 6), modes=('scatter', 'decimate', 'density'), w=3):
+    plt.switch_backend('Agg')
+    print('{:>10} {:>10} {:>10} {:>12}'.format('points', 'mode', 'time [s]', 'peak [MB]'))
+    for count in counts:
+        # Upper bound of the range holding at least `count` primes
+        n = max(16, int(count * (math.log(count) + math.log(math.log(count + 2)) + 2)))
+        prime_n = primes(n)[:count]
+        x, y, z = get_coordinate(prime_n, spiral_offsets(prime_n, w))
+        for mode in modes:
+            if mode == 'scatter' and count > SCATTER_LIMIT * 10:
+                print('{:>10} {:>10} {:>10} {:>12}'.format(count, mode, 'skipped', '-'))
+                continue
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            render(x, y, z, mode, output=io.BytesIO())
+            elapsed = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{:>10} {:>10} {:>10.3f} {:>12.1f}'.format(count, mode, elapsed, peak / 2 ** 20))
+
 
-plt.style.use('dark_background')
-fig = plt.figure(figsize=(8, 8))
-ax = plt.axes(projection ='3d')
-plt.axis("off")
-ax.scatter(x, y, z, s=1)
-plt.show()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Display prime numbers on a spiral.')
+    parser.add_argument('--mode', choices=RENDER_MODES, default='auto', help='how to draw the points (default auto)')
+    parser.add_argument('--output', help='write a PNG to this path instead of opening a window')
+    parser.add_argument('--bench', action='store_true', help='benchmark render time and memory against point count')
+    parser.add_argument('--check-cache', action='store_true', help='compare the serial and the parallel prime cache')
+    args = parser.parse_args()
+    if args.bench:
+        benchmark_render()
+        raise SystemExit
+    if args.check_cache:
+        check_cache()
+        raise SystemExit
 
+    print("Input number of natural numbers:")
+    amount = int(input())
+    t0 = time.time()
+    cache = PrimeCache(CACHE_FILE)
+    prime_n = cache.primes_in(0, amount)
+    c = len(prime_n)
+    print("Total prime numbers in range:", c)
+    t1 = time.time()
+    print("Time required:", t1 - t0)
 
+    print("Input number which will shape our graph (2;10):")
+    w = int(input())
+    d = spiral_offsets(prime_n, w)
+    x, y, z = get_coordinate(prime_n, d)
+    render(x, y, z, args.mode, args.output)
@@ -1,60 +1,328 @@
-import math
-from collections import Counter
-
-print('-'*40)
-u = int(input("Enter the number of elements: "))
-P = list(map(int,input("Enter elements (5 1 1 ..): ").strip().split()))[:u]
-print("The Pruffer number is: ",P)
-
-n = len(P)+2
-j = []
-i = 0
-
-for x in range(1,n+1):
-    if x in P:
-        counts = Counter(P)
-        h = counts[x]
-    else:
-        h = 0
-    j.append(h+1)
+import argparse
+import os
+import time
+import numpy as np
+
+# Elements of a Pruffer number read per chunk
+CHUNK_SIZE = 1 << 20
+
+# Decode a Pruffer number given as consecutive chunks, yielding an array of edges for every chunk
+# plus the final edge. degree[v] is 1 + the number of times v occurs, n the number of vertices.
+# Linear time: the smallest leaf is tracked with a pointer that only moves forward, and a vertex
+# that becomes a leaf below the pointer is used right away.
+def _decode_chunks(degree, chunks, n):
+    ptr = 1
+    while degree[ptr] != 1:
+        ptr += 1
+    leaf = ptr
+    for chunk in chunks:
+        # The i-th edge joins the current smallest leaf with P[i]
+        leaves = [0] * len(chunk)
+        for i, v in enumerate(chunk.tolist()):
+            leaves[i] = leaf
+            degree[v] -= 1
+            if degree[v] == 1 and v < ptr:
+                leaf = v
+            else:
+                ptr += 1
+                while degree[ptr] != 1:
+                    ptr += 1
+                leaf = ptr
+        yield np.column_stack((np.array(leaves, dtype=np.int64), chunk))
+    yield np.array([[leaf, n]], dtype=np.int64)
 
-print('-'*40)
-print(j)
-print('Edge of the tree is: ({},{})'.format(j.index(min(j))+1,P[i]))
+# Edges of the tree with the given Pruffer number (vertices 1..n, n = len(P) + 2) as an (n-1, 2) array
+def decode(P):
+    P = np.asarray(P, dtype=np.int64)
+    n = len(P) + 2
+    if len(P) and (P.min() < 1 or P.max() > n):
+        raise ValueError('elements of the Pruffer number must be between 1 and {}'.format(n))
+    degree = (np.bincount(P, minlength=n + 1) + 1).tolist()
+    return np.concatenate(list(_decode_chunks(degree, [P], n)))
 
-while True:
-    a=j.index(min(j))
-    j[a]=j[a]-1
-    
-    for x in j:
-        if x==0:
-            l=j.index(x)
-            j[l]=math.inf
+# Pruffer number of the tree given by its (n-1, 2) edge list on vertices 1..n, in linear time.
+# Every vertex keeps the XOR of its neighbours, so the neighbour of a leaf is known without adjacency lists.
+def encode(edges):
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    n = len(edges) + 1
+    if n < 2:
+        raise ValueError('a tree needs at least one edge')
+    a, b = edges[:, 0], edges[:, 1]
+    if edges.min() < 1 or edges.max() > n or (a == b).any():
+        raise ValueError('edges must join two different vertices between 1 and {}'.format(n))
+    # Sentinel vertex n + 1 stops the pointer scan
+    degree = np.bincount(edges.ravel(), minlength=n + 2)
+    degree[n + 1] = 1
+    degree = degree.tolist()
+    neighbours = np.zeros(n + 2, dtype=np.int64)
+    np.bitwise_xor.at(neighbours, a, b)
+    np.bitwise_xor.at(neighbours, b, a)
+    neighbours = neighbours.tolist()
+    P = [0] * (n - 2)
+    ptr = 1
+    while degree[ptr] != 1:
+        ptr += 1
+    leaf = ptr
+    for i in range(n - 2):
+        if leaf > n:
+            raise ValueError('edges do not form a tree')
+        v = neighbours[leaf]
+        P[i] = v
+        neighbours[v] ^= leaf
+        degree[v] -= 1
+        if degree[v] == 0:
+            raise ValueError('edges do not form a tree')
+        if degree[v] == 1 and v < ptr:
+            leaf = v
+        else:
+            ptr += 1
+            while degree[ptr] != 1:
+                ptr += 1
+            leaf = ptr
+    if n > 2 and (leaf > n or degree[neighbours[leaf]] != 1):
+        raise ValueError('edges do not form a tree')
+    return np.array(P, dtype=np.int64)
 
-    j[P[i]-1]=j[P[i]-1]-1
+# Move the pointers of the rows in `advance` forward to their next leaf, all rows in one step.
+# degree is the flattened (k, width) degree array and base holds the offset of every row.
+def _advance(degree, base, ptr, advance):
+    idx = np.flatnonzero(advance)
+    while len(idx):
+        ptr[idx] += 1
+        idx = idx[degree[base[idx] + ptr[idx]] != 1]
 
-    for x in j:
-        if x==0:
-            l=j.index(x)
-            j[l]=math.inf
+# Edges of many trees at once: a (k, m) array of Pruffer numbers gives a (k, m+1, 2) array.
+# All rows run the pointer algorithm of decode() in lockstep, one vectorized step per element.
+def decode_many(sequences):
+    S = np.asarray(sequences, dtype=np.int64)
+    if S.ndim != 2:
+        raise ValueError('sequences must be a 2-D array with one Pruffer number per row')
+    k, m = S.shape
+    n = m + 2
+    if S.size and (S.min() < 1 or S.max() > n):
+        raise ValueError('elements of the Pruffer number must be between 1 and {}'.format(n))
+    base = np.arange(k) * (n + 1)
+    degree = np.bincount((S + base[:, None]).ravel(), minlength=k * (n + 1)) + 1
+    leaves = np.empty((k, n - 1), dtype=np.int64)
+    ptr = np.ones(k, dtype=np.int64)
+    _advance(degree, base, ptr, degree[base + 1] != 1)
+    leaf = ptr.copy()
+    for i in range(m):
+        leaves[:, i] = leaf
+        v = S[:, i]
+        at = base + v
+        degree[at] -= 1
+        use_v = (degree[at] == 1) & (v < ptr)
+        ptr[~use_v] += 1
+        _advance(degree, base, ptr, ~use_v & (degree[base + ptr] != 1))
+        leaf = np.where(use_v, v, ptr)
+    leaves[:, n - 2] = leaf
+    return np.stack((leaves, np.concatenate((S, np.full((k, 1), n)), axis=1)), axis=2)
 
-    print(j)
-    if i < len(P)-1:
-        print('Edge of the tree is: ({},{})'.format(j.index(min(j))+1,P[i+1]))
+# Pruffer numbers of many trees at once: a (k, n-1, 2) array of edge lists gives a (k, n-2) array
+def encode_many(trees):
+    E = np.asarray(trees, dtype=np.int64)
+    if E.ndim != 3 or E.shape[2] != 2:
+        raise ValueError('trees must have the shape (k, n-1, 2)')
+    k, n = E.shape[0], E.shape[1] + 1
+    a, b = E[:, :, 0], E[:, :, 1]
+    if E.size and (E.min() < 1 or E.max() > n or (a == b).any()):
+        raise ValueError('edges must join two different vertices between 1 and {}'.format(n))
+    base = np.arange(k) * (n + 2)
+    degree = np.bincount((E + base[:, None, None]).ravel(), minlength=k * (n + 2))
+    degree[base + n + 1] = 1
+    neighbours = np.zeros(k * (n + 2), dtype=np.int64)
+    np.bitwise_xor.at(neighbours, (a + base[:, None]).ravel(), b.ravel())
+    np.bitwise_xor.at(neighbours, (b + base[:, None]).ravel(), a.ravel())
+    P = np.empty((k, n - 2), dtype=np.int64)
+    ptr = np.ones(k, dtype=np.int64)
+    _advance(degree, base, ptr, degree[base + 1] != 1)
+    leaf = ptr.copy()
+    for i in range(n - 2):
+        if (leaf > n).any():
+            raise ValueError('edges do not form a tree')
+        v = neighbours[base + leaf]
+        P[:, i] = v
+        at = base + v
+        neighbours[at] ^= leaf
+        degree[at] -= 1
+        if (degree[at] == 0).any():
+            raise ValueError('edges do not form a tree')
+        use_v = (degree[at] == 1) & (v < ptr)
+        ptr[~use_v] += 1
+        _advance(degree, base, ptr, ~use_v & (degree[base + ptr] != 1))
+        leaf = np.where(use_v, v, ptr)
+    if n > 2 and ((leaf > n).any() or (degree[base + neighbours[base + leaf]] != 1).any()):
+        raise ValueError('edges do not form a tree')
+    return P
 
+# Uniformly random labelled trees on n vertices, as a (count, n-1, 2) array of edge lists
+def random_trees(count, n, seed=None):
+    rng = np.random.default_rng(seed)
+    return decode_many(rng.integers(1, n + 1, size=(count, n - 2)))
+
+# Format of a sequence file from its extension: .npy, raw little-endian int32 for .bin/.raw, text otherwise
+def _file_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return 'npy'
+    if ext in ('.bin', '.raw'):
+        return 'int32'
+    return 'text'
+
+# Chunks of a Pruffer number stored in a file. Binary files are memory-mapped, text files
+# (whitespace separated numbers) are parsed block by block, so only one chunk is in memory.
+def iter_sequence(path, fmt='auto', chunk_size=CHUNK_SIZE):
+    if fmt == 'auto':
+        fmt = _file_format(path)
+    if fmt == 'text':
+        with open(path, 'rb') as f:
+            rest = b''
+            while True:
+                block = f.read(8 * chunk_size)
+                if not block:
+                    break
+                block = rest + block
+                # Keep a number cut at the end of the block for the next one
+                end = max(block.rfind(b' '), block.rfind(b'\n'), block.rfind(b'\t'), block.rfind(b'\r'))
+                if end < 0:
+                    rest = block
+                    continue
+                block, rest = block[:end], block[end:]
+                if block.strip():
+                    yield np.fromstring(block, dtype=np.int64, sep=' ')
+            if rest.strip():
+                yield np.fromstring(rest, dtype=np.int64, sep=' ')
+        return
+    if fmt == 'npy':
+        data = np.load(path, mmap_mode='r')
     else:
-        print('Edge of the tree is: ({},{})'.format(j.index(1)+1,j.index(1, j.index(1)+1, len(j))+1))
+        data = np.memmap(path, dtype=np.dtype(fmt).newbyteorder('<'), mode='r') if os.path.getsize(path) else np.zeros(0, dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        yield np.asarray(data[start:start + chunk_size], dtype=np.int64)
 
-    if len(P) == j.count(math.inf):
-        break
-    i += 1
+# Degree array and number of vertices of a Pruffer number stored in a file, in one pass over the file
+def _file_degrees(path, fmt, chunk_size):
+    counts = np.zeros(1, dtype=np.int64)
+    total = 0
+    for chunk in iter_sequence(path, fmt, chunk_size):
+        if not len(chunk):
+            continue
+        if chunk.min() < 1:
+            raise ValueError('elements of the Pruffer number must be positive')
+        total += len(chunk)
+        chunk_counts = np.bincount(chunk)
+        if len(chunk_counts) > len(counts):
+            chunk_counts[:len(counts)] += counts
+            counts = chunk_counts
+        else:
+            counts[:len(chunk_counts)] += chunk_counts
+    n = total + 2
+    if len(counts) > n + 1:
+        raise ValueError('elements of the Pruffer number must be between 1 and {}'.format(n))
+    degree = np.ones(n + 1, dtype=np.int64)
+    degree[:len(counts)] += counts
+    return degree.tolist(), n
 
-print('-'*40)
+# Decode a Pruffer number stored in a file, yielding the edges chunk by chunk. The file is read
+# twice (degrees first), memory is the degree array plus one chunk.
+def iter_decode_file(path, fmt='auto', chunk_size=CHUNK_SIZE):
+    degree, n = _file_degrees(path, fmt, chunk_size)
+    yield from _decode_chunks(degree, iter_sequence(path, fmt, chunk_size), n)
 
+# Decode a Pruffer number file into an edge file: "a b" lines, or an (n-1, 2) array for .npy.
+# Returns the number of edges written.
+def decode_file(path, output, fmt='auto', chunk_size=CHUNK_SIZE):
+    degree, n = _file_degrees(path, fmt, chunk_size)
+    edges = _decode_chunks(degree, iter_sequence(path, fmt, chunk_size), n)
+    count = 0
+    if output.lower().endswith('.npy'):
+        out = np.lib.format.open_memmap(output, mode='w+', dtype=np.int64, shape=(n - 1, 2))
+        for chunk in edges:
+            out[count:count + len(chunk)] = chunk
+            count += len(chunk)
+        out.flush()
+        del out
+    else:
+        with open(output, 'w') as f:
+            for chunk in edges:
+                f.write('%d %d\n' * len(chunk) % tuple(chunk.ravel().tolist()))
+                count += len(chunk)
+    return count
 
+# Round trip property: decode then encode gives back the Pruffer number, and the batch functions
+# agree with the single tree ones. Raises AssertionError on the first failure, also under python -O.
+def check_round_trip(trials=1000, max_n=30, seed=None):
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        n = int(rng.integers(2, max_n + 1))
+        k = int(rng.integers(1, 8))
+        S = rng.integers(1, n + 1, size=(k, n - 2))
+        trees = decode_many(S)
+        for P, edges in zip(S, trees):
+            if not np.array_equal(decode(P), edges):
+                raise AssertionError('decode and decode_many differ for {}'.format(P))
+            # Relabelling the edge order or the ends of an edge must not change the code
+            shuffled = rng.permutation(edges)[:, ::-1] if n > 2 else edges
+            if not np.array_equal(encode(shuffled), P):
+                raise AssertionError('encode does not give back {}'.format(P))
+        if not np.array_equal(encode_many(trees), S):
+            raise AssertionError('encode_many does not give back {}'.format(S))
+    print('{} round trips passed'.format(trials))
 
+# Trees per second of the single and the batch functions
+def benchmark(count=100000, n=50, seed=0):
+    S = np.random.default_rng(seed).integers(1, n + 1, size=(count, n - 2))
+    sample = min(count, 5000)
+    results = []
+    t0 = time.perf_counter()
+    trees = [decode(P) for P in S[:sample]]
+    results.append(('decode', sample / (time.perf_counter() - t0)))
+    t0 = time.perf_counter()
+    [encode(edges) for edges in trees]
+    results.append(('encode', sample / (time.perf_counter() - t0)))
+    t0 = time.perf_counter()
+    trees = decode_many(S)
+    results.append(('decode_many', count / (time.perf_counter() - t0)))
+    t0 = time.perf_counter()
+    encode_many(trees)
+    results.append(('encode_many', count / (time.perf_counter() - t0)))
+    print('{} trees with {} vertices'.format(count, n))
+    for name, rate in results:
+        print('{:<12} {:>12.0f} trees/s'.format(name, rate))
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Edges of a tree from its Pruffer number.')
+    parser.add_argument('--check', action='store_true', help='run the encode/decode round trip check')
+    parser.add_argument('--bench', action='store_true', help='measure trees per second')
+    parser.add_argument('--input', help='read the Pruffer number from this file (text, .npy or raw int32 .bin)')
+    parser.add_argument('--output', help='write the edges to this file (text or .npy), default is to print them')
+    parser.add_argument('--format', default='auto', help='input format: auto, text, npy or a NumPy dtype such as int32')
+    args = parser.parse_args()
+    if args.input:
+        if args.output:
+            count = decode_file(args.input, args.output, args.format)
+            print('{} edges written to {}'.format(count, args.output))
+        else:
+            for chunk in iter_decode_file(args.input, args.format):
+                for a, b in chunk.tolist():
+                    print('Edge of the tree is: ({},{})'.format(a, b))
+        raise SystemExit
+    if args.check or args.bench:
+        if args.check:
+            check_round_trip()
+        if args.bench:
+            benchmark()
+        raise SystemExit
 
+    print('-'*40)
+    u = int(input("Enter the number of elements: "))
+    P = list(map(int,input("Enter elements (5 1 1 ..): ").strip().split()))[:u]
+    print("The Pruffer number is: ",P)
 
+    print('-'*40)
+    for a, b in decode(P).tolist():
+        print('Edge of the tree is: ({},{})'.format(a, b))
 
+    print('-'*40)
@@ -1,10 +1,20 @@
 # Libraries
-import pygame
 import sys
+import argparse
+import functools
+import hashlib
 import math
+import pickle
 import random
-
-pygame.init()
+import struct
+import time
+import zlib
+import numpy as np
+# pygame is only needed to watch the simulation, headless runs work without it
+try:
+    import pygame
+except ImportError:
+    pygame = None
 
 # Constants
 WIDTH, HEIGHT = 800, 600
@@ -14,285 +24,1034 @@ PLANET2_COLOR = (100, 100, 200)
 ASTEROID_COLOR = (173, 216, 230)
 G = 20 # Gravitational constant
 frame_rate = 120
-time_step = 1 / frame_rate
+# Physics advances in steps of this length whatever the rendering frame rate is
+time_step = 1 / 120
+# Longest frame the viewer catches up on, a slower frame makes the simulation run behind real time
+MAX_FRAME_TIME = 0.25
+
+# Gravity between two bodies closer than this is smoothed instead of growing without bound
+SOFTENING = 1
+# Rows of the pair matrix computed at once, small blocks stay in the cache
+GRAVITY_BLOCK = 64
+# Opening angle of the Barnes-Hut solver, smaller is more accurate and slower
+THETA = 0.5
+# Levels of the Barnes-Hut quadtree below its root
+QUADTREE_DEPTH = 16
+# Bodies in a quadtree cell that are summed directly instead of splitting the cell further
+QUADTREE_LEAF = 8
+
+PLANET = 0
+ASTEROID = 1
+# Below this many bodies testing every pair is cheaper than building the collision grid
+COLLISION_ALL_PAIRS = 48
+# Asteroids that touch each other merge into one
+ASTEROID_MERGING = True
+# Most explosion particles and shockwaves alive at once, new ones are dropped while the pools are full
+PARTICLE_CAPACITY = 8192
+SHOCKWAVE_CAPACITY = 1024
+# Default integrator, and the substep rule for close encounters: a body's step is at most ADAPTIVE_ETA
+# times its free-fall time with the closest other body, using at most MAX_SUBSTEPS substeps
+INTEGRATOR = 'verlet'
+ADAPTIVE_ETA = 0.05
+MAX_SUBSTEPS = 64
+# Steps between the checkpoints stored while replaying a log
+CHECKPOINT_INTERVAL = 1200
+
+# Input log: a header with everything needed to rebuild the world, then one record per launched asteroid.
+# The header holds the magic, seed, dt, solver name, theta, integrator and substepping; a record holds the step and position, and
+# a record with x = NaN marks the step where the recording ended.
+LOG_MAGIC = b'SIML'
+LOG_HEADER = struct.Struct('<4sQd16sd16s?')
+LOG_EVENT = struct.Struct('<Idd')
 
 # Classes
-class CelestialObject:
-    def __init__(self, x, y, mass, radius, color):
-        self.x = x
-        self.y = y
-        self.mass = mass
-        self.radius = radius
-        self.color = color
-        self.acceleration_x = 0
-        self.acceleration_y = 0
-        self.velocity_x = 0
-        self.velocity_y = 0
-
-    def apply_gravity(self, other):
-        if other is not None and self.mass != 0:
-            dx = other.x - self.x
-            dy = other.y - self.y
-            distance = max(1, math.sqrt(dx ** 2 + dy ** 2))
-            force = G * self.mass * other.mass / (distance ** 2) # Newton's law of gravitation
-            angle = math.atan2(dy, dx)
-            self.acceleration_x = force * math.cos(angle) / self.mass
-            self.acceleration_y = force * math.sin(angle) / self.mass
-            self.velocity_x += self.acceleration_x * time_step
-            self.velocity_y += self.acceleration_y * time_step
+# Structure of arrays holding every planet and asteroid, only the first `count` rows are in use
+class Bodies:
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.acceleration = np.zeros((capacity, 2))
+        self.mass = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        # Planet an asteroid was aimed at, -1 for none
+        self.target = np.full(capacity, -1)
 
-    def update(self):
-        self.x += 0.5 * self.acceleration_x * time_step ** 2 + self.velocity_x * time_step
-        self.y += 0.5 * self.acceleration_y * time_step ** 2 + self.velocity_y * time_step
-
-class Planet(CelestialObject):
-    def __init__(self, x, y, mass, radius, color):
-        super().__init__(x, y, mass, radius, color)
-        self.shockwaves = []
-
-class Asteroid(CelestialObject):
-    def __init__(self, x, y, mass, radius, color, velocity_x, velocity_y):
-        super().__init__(x, y, mass, radius, color)
-        self.velocity_x = velocity_x
-        self.velocity_y = velocity_y
-        self.target_planet = None 
-
-class Particle:
-    def __init__(self, x, y, size, color):
-        self.x = x
-        self.y = y
-        self.size = size
+    COLUMNS = ('position', 'velocity', 'acceleration', 'mass', 'radius', 'kind', 'color', 'target')
+
+    def add(self, x, y, mass, radius, color, kind, velocity_x=0, velocity_y=0, target=-1):
+        if self.count == len(self.mass):
+            # Double the capacity so adding stays amortized O(1)
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                grown = np.zeros((2 * len(column),) + column.shape[1:], dtype=column.dtype)
+                grown[:self.count] = column[:self.count]
+                setattr(self, name, grown)
+            self.target[self.count:] = -1
+        i = self.count
+        self.position[i] = x, y
+        self.velocity[i] = velocity_x, velocity_y
+        self.acceleration[i] = 0
+        self.mass[i] = mass
+        self.radius[i] = radius
+        self.kind[i] = kind
+        self.color[i] = color
+        self.target[i] = target
+        self.count += 1
+        return i
+
+    # Drop the bodies selected by a boolean mask, the order of the rest (and so the planet rows) is kept
+    def remove(self, mask):
+        keep = np.flatnonzero(~mask[:self.count])
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            column[:len(keep)] = column[keep]
+        self.count = len(keep)
+
+# Acceleration of every body caused by all the others, without any trigonometry.
+# Softened gravity a = G * m * d / (|d|^2 + eps^2)^(3/2) replaces the max(1, distance) clamp.
+# Pairs are evaluated in float32 blocks of GRAVITY_BLOCK rows, a body's own pair has d = 0 and adds nothing.
+def direct_gravity(position, mass, softening=SOFTENING):
+    n = len(position)
+    acceleration = np.zeros((n, 2))
+    x = position[:, 0].astype(np.float32)
+    y = position[:, 1].astype(np.float32)
+    m = mass.astype(np.float32)
+    eps2 = np.float32(softening ** 2)
+    for start in range(0, n, GRAVITY_BLOCK):
+        stop = min(start + GRAVITY_BLOCK, n)
+        dx = x[None, :] - x[start:stop, None]
+        dy = y[None, :] - y[start:stop, None]
+        r2 = dx * dx
+        r2 += dy * dy
+        r2 += eps2
+        w = np.sqrt(r2)
+        w *= r2
+        np.divide(m, w, out=w)
+        acceleration[start:stop, 0] = np.einsum('ij,ij->i', w, dx)
+        acceleration[start:stop, 1] = np.einsum('ij,ij->i', w, dy)
+    return G * acceleration
+
+# Spread the lowest 16 bits of every number to the even bit positions
+def _spread_bits(v):
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+# Barnes-Hut quadtree stored level by level. Every body gets a Morton code on a square root cell that
+# covers the WIDTH x HEIGHT domain (grown to fit bodies outside of it); the cells of level L are the
+# distinct codes shifted right by 2 * (depth - L), so each level is a sorted array of cell keys with
+# the mass, centre of mass, body count and first body (in Morton order) of every cell.
+class QuadTree:
+    def __init__(self, position, mass, max_depth=QUADTREE_DEPTH, leaf_size=QUADTREE_LEAF):
+        low = np.minimum(position.min(axis=0), 0)
+        high = np.maximum(position.max(axis=0), (WIDTH, HEIGHT))
+        self.size = float((high - low).max()) * (1 + 1e-9)
+        self.depth = max_depth
+        self.leaf_size = leaf_size
+        cells = 1 << max_depth
+        q = np.clip(((position - low) / self.size * cells).astype(np.int64), 0, cells - 1)
+        self.code = (_spread_bits(q[:, 0]) << np.uint64(1)) | _spread_bits(q[:, 1])
+        self.order = np.argsort(self.code, kind='stable')
+        code, m, p = self.code[self.order], mass[self.order], position[self.order]
+        self.levels = []
+        for level in range(max_depth + 1):
+            keys = code >> np.uint64(2 * (max_depth - level))
+            starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+            cell_mass = np.add.reduceat(m, starts)
+            weight = np.where(cell_mass != 0, cell_mass, 1)
+            centre = np.add.reduceat(p * m[:, None], starts) / weight[:, None]
+            count = np.diff(np.append(starts, len(keys)))
+            self.levels.append((keys[starts], cell_mass, centre, count, starts))
+            # Stop once every cell is small enough to be summed body by body
+            if count.max() <= leaf_size:
+                break
+
+    # Key of the cell of a level that holds each of the given bodies
+    def key(self, bodies, level):
+        return self.code[bodies] >> np.uint64(2 * (self.depth - level))
+
+# Acceleration of every body with the Barnes-Hut approximation: a cell of size s seen at distance d is
+# used as one point mass when s / d < theta, otherwise its children (or, for a leaf, its bodies) are
+# visited. All body-cell pairs of one tree level are handled together as arrays.
+def barnes_hut_gravity(position, mass, softening=SOFTENING, theta=THETA, batch=4096):
+    n = len(position)
+    acceleration = np.zeros((n, 2))
+    if n == 0:
+        return acceleration
+    tree = QuadTree(position, mass)
+    last = len(tree.levels) - 1
+    eps2 = softening ** 2
+
+    def add(body, m, d):
+        r2 = (d * d).sum(axis=1) + eps2
+        w = m / (r2 * np.sqrt(r2))
+        acceleration[:, 0] += np.bincount(body, weights=w * d[:, 0], minlength=n)
+        acceleration[:, 1] += np.bincount(body, weights=w * d[:, 1], minlength=n)
+
+    for first in range(0, n, batch):
+        body = np.arange(first, min(first + batch, n))
+        cell = np.zeros(len(body), dtype=np.int64)
+        for level, (keys, cell_mass, centre, count, starts) in enumerate(tree.levels):
+            d = centre[cell] - position[body]
+            cell_size = tree.size / (1 << level)
+            far = cell_size * cell_size < theta * theta * (d * d).sum(axis=1)
+            # A cell holding the body itself is always opened
+            far &= tree.key(body, level) != keys[cell]
+            add(body[far], cell_mass[cell[far]], d[far])
+            near = ~far
+            leaf = near & ((count[cell] <= tree.leaf_size) | (level == last))
+            if leaf.any():
+                # Sum the bodies of near leaves one by one, a body's own pair has d = 0 and adds nothing
+                sizes = count[cell[leaf]]
+                pair_body = np.repeat(body[leaf], sizes)
+                offset = np.arange(len(pair_body)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+                other = tree.order[np.repeat(starts[cell[leaf]], sizes) + offset]
+                add(pair_body, mass[other], position[other] - position[pair_body])
+            if level == last:
+                break
+            # Open the other near cells: look up their (up to four) children on the next level
+            inner = near & ~leaf
+            body, parent = body[inner], keys[cell[inner]]
+            if not len(body):
+                break
+            child_keys = tree.levels[level + 1][0]
+            children = (parent[:, None] << np.uint64(2)) | np.arange(4, dtype=np.uint64)
+            found = np.minimum(np.searchsorted(child_keys, children), len(child_keys) - 1)
+            exists = child_keys[found] == children
+            body = np.repeat(body, exists.sum(axis=1))
+            cell = found[exists]
+    return G * acceleration
+
+# Gravity solvers selectable for the simulation
+SOLVERS = {'direct': direct_gravity, 'barnes-hut': barnes_hut_gravity}
+
+def make_solver(name, theta=THETA):
+    if name == 'barnes-hut':
+        return functools.partial(barnes_hut_gravity, theta=theta)
+    return SOLVERS[name]
+
+# Time per step of both solvers and the error of Barnes-Hut against the direct sum
+def benchmark_gravity(counts=(1000, 5000, 20000, 50000), thetas=(0.3, 0.5, 0.8), direct_limit=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    print('{:>8} {:>12} {:>8} {:>12} {:>12} {:>12}'.format('bodies', 'solver', 'theta', 'time [ms]', 'median err', 'max err'))
+    for count in counts:
+        position = rng.uniform((0, 0), (WIDTH, HEIGHT), size=(count, 2))
+        mass = np.full(count, 100.0)
+        position[:2] = (WIDTH // 3, HEIGHT // 2), (2 * WIDTH // 3, HEIGHT // 2)
+        mass[:2] = 5000, 7000
+        reference = None
+        if count <= direct_limit:
+            t0 = time.perf_counter()
+            reference = direct_gravity(position, mass)
+            elapsed = time.perf_counter() - t0
+            print('{:>8} {:>12} {:>8} {:>12.1f} {:>12} {:>12}'.format(count, 'direct', '-', elapsed * 1e3, '-', '-'))
+        for theta in thetas:
+            t0 = time.perf_counter()
+            approximation = barnes_hut_gravity(position, mass, theta=theta)
+            elapsed = time.perf_counter() - t0
+            if reference is None:
+                median = worst = '-'
+            else:
+                error = np.hypot(*(approximation - reference).T) / np.maximum(np.hypot(*reference.T), 1e-12)
+                median, worst = '{:.2e}'.format(np.median(error)), '{:.2e}'.format(error.max())
+            print('{:>8} {:>12} {:>8} {:>12.1f} {:>12} {:>12}'.format(count, 'barnes-hut', theta, elapsed * 1e3, median, worst))
+
+# Gravity for the bodies in the store: planets do not attract each other, bodies without mass do not move
+def compute_gravity(bodies, solver=direct_gravity):
+    n = bodies.count
+    position, mass = bodies.position[:n], bodies.mass[:n]
+    acceleration = solver(position, mass)
+    planets = np.flatnonzero(bodies.kind[:n] == PLANET)
+    for i in planets:
+        for j in planets:
+            if i != j:
+                d = position[j] - position[i]
+                r2 = d @ d + SOFTENING ** 2
+                acceleration[i] -= G * mass[j] * d / (r2 * math.sqrt(r2))
+    acceleration[mass == 0] = 0
+    bodies.acceleration[:n] = acceleration
+
+# Drift and kick fractions of dt for one step of each integrator. Leapfrog (velocity Verlet in its
+# drift-kick-drift form) needs one gravity evaluation per step; Yoshida's 4th order scheme chains three
+# leapfrog steps of w1, w0, w1 and needs three. 'euler' is the original kick then drift update.
+_W1 = 1 / (2 - 2 ** (1 / 3))
+_W0 = 1 - 2 * _W1
+INTEGRATORS = {
+    'euler': None,
+    'verlet': ((0.5, 1), (0.5, 0)),
+    'yoshida': ((_W1 / 2, _W1), ((_W0 + _W1) / 2, _W0), ((_W0 + _W1) / 2, _W1), (_W1 / 2, 0)),
+}
+
+# One step of dt for bodies at `position` and `velocity` (both updated in place);
+# accelerate(position, t) gives their acceleration at time t into the step
+def advance(position, velocity, accelerate, dt, integrator='verlet'):
+    if integrator == 'euler':
+        acceleration = accelerate(position, 0)
+        velocity += acceleration * dt
+        position += 0.5 * acceleration * dt ** 2 + velocity * dt
+        return
+    t = 0
+    for drift, kick in INTEGRATORS[integrator]:
+        position += drift * dt * velocity
+        t += drift * dt
+        if kick:
+            velocity += kick * dt * accelerate(position, t)
+
+# Gravity on the bodies `group` only, in double precision, with the same exclusions as compute_gravity
+def gravity_on(group, position, mass, kind, softening=SOFTENING):
+    d = position[None, :] - position[group, None]
+    r2 = (d ** 2).sum(axis=2) + softening ** 2
+    w = mass / (r2 * np.sqrt(r2))
+    w[np.ix_(kind[group] == PLANET, kind == PLANET)] = 0
+    acceleration = G * np.einsum('ij,ijk->ik', w, d)
+    acceleration[mass[group] == 0] = 0
+    return acceleration
+
+# Substeps each body needs in a step of dt: the step is at most eta times the free-fall time
+# sqrt(r^3 / G(m1 + m2)) of the body and its closest partner, rounded down to dt over a power of two.
+# Only pairs within the distance where that time drops below dt / eta can need substeps, and the
+# collision grid finds them when every body gets the radius (G m (dt / eta)^2)^(1/3).
+def substeps(bodies, dt, eta=ADAPTIVE_ETA, max_substeps=MAX_SUBSTEPS):
+    n = bodies.count
+    position, mass, kind = bodies.position[:n], np.abs(bodies.mass[:n]), bodies.kind[:n]
+    count = np.ones(n, dtype=int)
+    i, j = collision_pairs(position, np.cbrt(G * mass * (dt / eta) ** 2))
+    # Planets do not pull each other
+    keep = (kind[i] != PLANET) | (kind[j] != PLANET)
+    i, j = i[keep], j[keep]
+    if len(i) == 0:
+        return count
+    r2 = ((position[i] - position[j]) ** 2).sum(axis=1) + SOFTENING ** 2
+    fall = np.sqrt(r2 * np.sqrt(r2) / (G * (mass[i] + mass[j])))
+    shortest = np.full(n, np.inf)
+    np.minimum.at(shortest, i, fall)
+    np.minimum.at(shortest, j, fall)
+    ratio = dt / (eta * shortest)
+    np.power(2, np.ceil(np.log2(np.maximum(ratio, 1))), out=ratio)
+    return np.minimum(ratio, max_substeps).astype(int)
+
+# Move every body by one step of dt. With `adaptive`, bodies in a close encounter are then redone in
+# substeps, seeing the other bodies move in a straight line between their start and end positions.
+def integrate(bodies, solver, dt, integrator='verlet', adaptive=True):
+    n = bodies.count
+    position, velocity = bodies.position[:n], bodies.velocity[:n]
+    fast = np.zeros(0, dtype=int)
+    if adaptive and n > 1:
+        count = substeps(bodies, dt)
+        fast = np.flatnonzero(count > 1)
+    if len(fast):
+        start_position, start_velocity = position.copy(), velocity[fast].copy()
+
+    def accelerate(position, t):
+        compute_gravity(bodies, solver)
+        return bodies.acceleration[:n]
+    advance(position, velocity, accelerate, dt, integrator)
+
+    if len(fast):
+        end_position = position.copy()
+        mass, kind = bodies.mass[:n], bodies.kind[:n]
+        for k in np.unique(count[fast]):
+            chosen = count[fast] == k
+            group = fast[chosen]
+            p, v = start_position[group].copy(), start_velocity[chosen]
+            h = dt / k
+            for s in range(k):
+                def accelerate_group(p, t):
+                    others = start_position + (end_position - start_position) * ((s * h + t) / dt)
+                    others[group] = p
+                    return gravity_on(group, others, mass, kind)
+                advance(p, v, accelerate_group, h, integrator)
+            position[group] = p
+            velocity[group] = v
+
+# Kinetic energy plus the potential of softened gravity, without the planet-planet pairs
+def energy(bodies, softening=SOFTENING):
+    n = bodies.count
+    position, velocity, mass, kind = bodies.position[:n], bodies.velocity[:n], bodies.mass[:n], bodies.kind[:n]
+    d = position[None, :] - position[:, None]
+    pair = mass[:, None] * mass / np.sqrt((d ** 2).sum(axis=2) + softening ** 2)
+    pair[np.ix_(kind == PLANET, kind == PLANET)] = 0
+    np.fill_diagonal(pair, 0)
+    return 0.5 * (mass * (velocity ** 2).sum(axis=1)).sum() - G * pair.sum() / 2
+
+# Relative energy drift of every integrator, with and without substeps, for asteroids on eccentric
+# orbits around both planets (no collisions or walls, gravity only)
+def benchmark_integrators(dts=(1 / 120, 1 / 30, 1 / 10), duration=10, asteroids=40, seed=0):
+    rng = np.random.default_rng(seed)
+    start = Bodies()
+    planets = [Planet(start, WIDTH // 3, HEIGHT // 2, 5000, 20, PLANET1_COLOR),
+               Planet(start, 2 * WIDTH // 3, HEIGHT // 2, 7000, 25, PLANET2_COLOR)]
+    for i in range(asteroids):
+        planet = planets[i % 2]
+        r, angle = rng.uniform(40, 120), rng.uniform(0, 2 * math.pi)
+        # Below the circular speed, so the orbit dives close to the planet
+        speed = rng.uniform(0.7, 0.95) * math.sqrt(G * planet.mass / r)
+        start.add(planet.x + r * math.cos(angle), planet.y + r * math.sin(angle), 100, 5, ASTEROID_COLOR, ASTEROID,
+                  -speed * math.sin(angle), speed * math.cos(angle))
+    e0 = energy(start)
+    print(f'{"integrator":>10} {"dt":>8} {"adaptive":>8} {"max drift":>10} {"time":>8}')
+    for integrator in INTEGRATORS:
+        for dt in dts:
+            for adaptive in (False, True):
+                bodies = pickle.loads(pickle.dumps(start))
+                drift = 0
+                t = time.perf_counter()
+                for _ in range(round(duration / dt)):
+                    integrate(bodies, direct_gravity, dt, integrator, adaptive)
+                    drift = max(drift, abs(energy(bodies) / e0 - 1))
+                elapsed = time.perf_counter() - t
+                print(f'{integrator:>10} {dt:8.4f} {str(adaptive):>8} {drift:10.2e} {elapsed:7.2f}s')
+
+# Pairs (i < j) of overlapping bodies. The broad phase is a hierarchy of uniform grids hashed to one
+# key per cell: every level doubles the cell size and every body sits in the level whose cells are as
+# wide as it is, so it only needs the neighbouring cells of its own level and of the coarser ones. The
+# narrow phase compares squared distances. Cells of the first level fit the typical body.
+def collision_pairs(position, radius, cell_size=None):
+    n = len(position)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if n <= COLLISION_ALL_PAIRS:
+        i, j = np.triu_indices(n, 1)
+        d = position[j] - position[i]
+        close = (d * d).sum(axis=1) < (radius[i] + radius[j]) ** 2
+        return i[close], j[close]
+    cell_size = cell_size or 2 * np.median(radius) or 1
+    level = np.ceil(np.log2(np.maximum(2 * radius, cell_size) / cell_size)).astype(np.int64)
+    origin = position.min(axis=0)
+    first, second = [], []
+
+    # Bodies of `query` against the bodies in the cells at the given offsets from theirs. In the own cell
+    # the search can start at `own_low` instead.
+    def visit(query, offsets, own_low=None):
+        if len(query) == 0:
+            return
+        offsets = np.array(offsets)
+        neighbour = (key[query, None] + offsets[:, 0] * stride + offsets[:, 1]).ravel()
+        low = np.searchsorted(sorted_key, neighbour, 'left')
+        if own_low is not None:
+            low = low.reshape(len(query), -1)
+            low[:, 0] = own_low
+            low = low.ravel()
+        high = np.searchsorted(sorted_key, neighbour, 'right')
+        count = np.maximum(high - low, 0)
+        first.append(np.repeat(np.repeat(query, len(offsets)), count))
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        second.append(order[np.repeat(low, count) + offset])
+
+    for depth in np.unique(level):
+        # Shift the cells so that every neighbour key is non negative and unique
+        cell = np.floor((position - origin) / (cell_size * 2.0 ** depth)).astype(np.int64) + 1
+        stride = cell[:, 1].max() + 2
+        key = cell[:, 0] * stride + cell[:, 1]
+        members = np.flatnonzero(level == depth)
+        order = members[np.argsort(key[members], kind='stable')]
+        sorted_key = key[order]
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        # Own cell plus half of the neighbours, so every pair of cells in the level is visited once
+        visit(members, ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)), rank[members] + 1)
+        # Smaller bodies look into all nine cells around them, each pair is found from its smaller body
+        visit(np.flatnonzero(level < depth), [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+    first, second = np.concatenate(first), np.concatenate(second)
+    d = position[second] - position[first]
+    close = (d * d).sum(axis=1) < (radius[first] + radius[second]) ** 2
+    i = np.minimum(first[close], second[close])
+    j = np.maximum(first[close], second[close])
+    order = np.lexsort((j, i))
+    return i[order], j[order]
+
+# Push two overlapping planets apart and exchange momentum along the line between them
+def collide_planets(planet1, planet2):
+    dx = planet2.x - planet1.x
+    dy = planet2.y - planet1.y
+    distance = math.sqrt(dx ** 2 + dy ** 2)
+
+    # Restitution coefficient (0 = perfectly inelastic, 1 = perfectly elastic)
+    restitution_coefficient = 0.3
+
+    # Calculate the normal vector along the collision axis
+    normal_x, normal_y = (dx / distance, dy / distance) if distance > 0 else (1, 0)
+    overlap = (planet1.radius + planet2.radius - distance)
+
+    # Move the planets apart so they don't overlap
+    planet1.x -= overlap * 0.5 * normal_x
+    planet1.y -= overlap * 0.5 * normal_y
+    planet2.x += overlap * 0.5 * normal_x
+    planet2.y += overlap * 0.5 * normal_y
+
+    # Calculate the relative velocity
+    relative_velocity_x = planet2.velocity_x - planet1.velocity_x
+    relative_velocity_y = planet2.velocity_y - planet1.velocity_y
+
+    # Calculate the dot product of the relative velocity and the normal
+    dot_product = relative_velocity_x * normal_x + relative_velocity_y * normal_y
+
+    # Update the velocities
+    planet1.velocity_x += 2 * restitution_coefficient * dot_product * normal_x
+    planet1.velocity_y += 2 * restitution_coefficient * dot_product * normal_y
+    planet2.velocity_x -= 2 * restitution_coefficient * dot_product * normal_x
+    planet2.velocity_y -= 2 * restitution_coefficient * dot_product * normal_y
+
+# Two colliding asteroids stick together in row i, keeping mass, momentum and area; row j is left for removal
+def merge_asteroids(bodies, i, j):
+    mass = bodies.mass[i] + bodies.mass[j]
+    if mass != 0:
+        bodies.position[i] = (bodies.mass[i] * bodies.position[i] + bodies.mass[j] * bodies.position[j]) / mass
+        bodies.velocity[i] = (bodies.mass[i] * bodies.velocity[i] + bodies.mass[j] * bodies.velocity[j]) / mass
+    bodies.mass[i] = mass
+    bodies.radius[i] = math.hypot(bodies.radius[i], bodies.radius[j])
+
+# A planet is a view of its row in the body store
+class Planet:
+    def __init__(self, bodies, x, y, mass, radius, color):
+        self.bodies = bodies
+        self.index = bodies.add(x, y, mass, radius, color, PLANET)
         self.color = color
-        self.velocity = [random.uniform(-0.07, 0.07), random.uniform(-0.07, 0.07)]
-        self.alpha = 255
-
-    def move(self):
-        self.x += self.velocity[0]
-        self.y += self.velocity[1]
-        self.alpha -= 0.4 
-
-    def is_faded(self):
-        return self.alpha <= 0
-    
-class Shockwave:
-    def __init__(self, x, y, max_radius, expansion_speed, initial_alpha, strength, creator_planet):
-        self.x = x
-        self.y = y
-        self.max_radius = max_radius
-        self.expansion_speed = expansion_speed
-        self.current_radius = 0
-        self.current_alpha = initial_alpha
-        self.strength = strength
-        self.creator_planet = creator_planet
+
+    def _column(name, k=None):
+        def get(self):
+            column = getattr(self.bodies, name)
+            return column[self.index] if k is None else column[self.index, k]
+        def set(self, value):
+            column = getattr(self.bodies, name)
+            if k is None:
+                column[self.index] = value
+            else:
+                column[self.index, k] = value
+        return property(get, set)
+
+    x = _column('position', 0)
+    y = _column('position', 1)
+    velocity_x = _column('velocity', 0)
+    velocity_y = _column('velocity', 1)
+    mass = _column('mass')
+    radius = _column('radius')
+    del _column
+
+# Fixed-capacity slots recycled through a free list kept as a stack of slot numbers
+class Pool:
+    def __init__(self, capacity):
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = np.arange(capacity)[::-1].copy()
+        self.free_count = capacity
+        # Scratch mask reused by every update
+        self._dead = np.zeros(capacity, dtype=bool)
+
+    # Up to `count` free slots, fewer when the pool is full
+    def take(self, count):
+        count = min(count, self.free_count)
+        self.free_count -= count
+        slots = self.free[self.free_count:self.free_count + count].copy()
+        self.alive[slots] = True
+        return slots
+
+    def release(self, slots):
+        self.alive[slots] = False
+        self.free[self.free_count:self.free_count + len(slots)] = slots
+        self.free_count += len(slots)
+
+    def __len__(self):
+        return len(self.alive) - self.free_count
+
+# Explosion particles, drifting and fading out one by one
+class ParticlePool(Pool):
+    def __init__(self, capacity=PARTICLE_CAPACITY, rng=random):
+        super().__init__(capacity)
+        self.rng = rng
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.alpha = np.zeros(capacity)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+
+    # Explosion of `count` particles at (x, y)
+    def emit(self, x, y, count=20):
+        slots = self.take(count)
+        rng = self.rng
+        for slot in slots:
+            self.size[slot] = rng.randint(2, 6)
+            self.color[slot] = (rng.randint(200, 255), rng.randint(100, 200), 0)
+            self.velocity[slot] = (rng.uniform(-0.07, 0.07), rng.uniform(-0.07, 0.07))
+        self.position[slots] = (x, y)
+        self.alpha[slots] = 255
 
     def update(self):
-        self.current_radius += self.expansion_speed
-        self.current_alpha -= 0.1  
-        if self.strength > 0:
-            self.strength -= 0.1
-
-    def is_faded(self):
-        return self.current_alpha <= 0  
-
-def create_explosion(x, y):
-    explosion = []
-    for _ in range(20):
-        size = random.randint(2, 6)
-        color = (random.randint(200, 255), random.randint(100, 200), 0)
-        particle = Particle(x, y, size, color)
-        explosion.append(particle)
-    return explosion
-
-# Create planets
-planet1 = Planet(WIDTH // 3, HEIGHT // 2, 5000, 20, PLANET1_COLOR)
-planet1.velocity_x = 0 
-planet1.velocity_y = 0  
-planet2 = Planet(2 * WIDTH // 3, HEIGHT // 2, 7000, 25, PLANET2_COLOR)
-planet2.velocity_x = 0  
-planet2.velocity_y = 0  
-
-asteroids = [] 
-explosions = [] 
-shockwaves = []
-planets_hit_by_asteroid = []
-
-# Screen
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Planetary Motion and Asteroid Impact")
-
-# Main simulation loop
-while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            x, y = event.pos
-            asteroid = Asteroid(x, y, 100, 5, ASTEROID_COLOR, 0, 0)
-
-            # Which planet was hit by the asteroid
-            if planet1.x - asteroid.x < planet1.radius and planet1.y - asteroid.y < planet1.radius:
-                asteroid.target_planet = planet1
-            elif planet2.x - asteroid.x < planet2.radius and planet2.y - asteroid.y < planet2.radius:
-                asteroid.target_planet = planet2
-            asteroids.append(asteroid)
-
-    # Apply gravity to planets and asteroids
-    for asteroid in asteroids:
-        planet1.apply_gravity(asteroid)
-        planet2.apply_gravity(asteroid)
-        asteroid.apply_gravity(planet1)
-        asteroid.apply_gravity(planet2)
-
-    # Gravity planet to planet
-    # planet1.apply_gravity(planet2)
-    # planet2.apply_gravity(planet1)
-
-    # Update positions and handle screen boundaries for planets
-    for planet in [planet1, planet2]:
-        planet.update()
-        if planet.x - planet.radius < 0:
-            planet.x = planet.radius
-            planet.velocity_x *= -0.7
-        elif planet.x + planet.radius > WIDTH:
-            planet.x = WIDTH - planet.radius
-            planet.velocity_x *= -0.7
-        if planet.y - planet.radius < 0:
-            planet.y = planet.radius
-            planet.velocity_y *= -0.7
-        elif planet.y + planet.radius > HEIGHT:
-            planet.y = HEIGHT - planet.radius
-            planet.velocity_y *= -0.7
-
-    # Planet-planet collisions
-    if planet1 != planet2:
-        dx = planet2.x - planet1.x
-        dy = planet2.y - planet1.y
-        distance = math.sqrt(dx ** 2 + dy ** 2)
-        
-        # Restitution coefficient (0 = perfectly inelastic, 1 = perfectly elastic)
-        restitution_coefficient = 0.3
-
-        if distance < planet1.radius + planet2.radius:
-            overlap = (planet1.radius + planet2.radius - distance)
-            angle = math.atan2(dy, dx)
-
-            # Move the planets apart so they don't overlap
-            planet1.x -= overlap * 0.5 * math.cos(angle)
-            planet1.y -= overlap * 0.5 * math.sin(angle)
-            planet2.x += overlap * 0.5 * math.cos(angle)
-            planet2.y += overlap * 0.5 * math.sin(angle)
-
-            # Calculate the relative velocity
-            relative_velocity_x = planet2.velocity_x - planet1.velocity_x
-            relative_velocity_y = planet2.velocity_y - planet1.velocity_y
-
-            # Calculate the normal vector along the collision axis
-            normal_x = math.cos(angle)
-            normal_y = math.sin(angle)
-
-            # Calculate the dot product of the relative velocity and the normal
-            dot_product = relative_velocity_x * normal_x + relative_velocity_y * normal_y
-
-            # Update the velocities
-            planet1.velocity_x += 2 * restitution_coefficient * dot_product * normal_x
-            planet1.velocity_y += 2 * restitution_coefficient * dot_product * normal_y
-            planet2.velocity_x -= 2 * restitution_coefficient * dot_product * normal_x
-            planet2.velocity_y -= 2 * restitution_coefficient * dot_product * normal_y
-
-    # Update positions and handle screen boundaries for asteroids
-    for asteroid in asteroids:
-        asteroid.update()
-        if asteroid.x - asteroid.radius < 0 or asteroid.x + asteroid.radius > WIDTH:
-            asteroid.velocity_x *= -0.7
-        if asteroid.y - asteroid.radius < 0 or asteroid.y + asteroid.radius > HEIGHT:
-            asteroid.velocity_y *= -0.7
-
-    # Asteroid-planet collisions
-    for asteroid in asteroids[:]:
-        for planet in [planet1, planet2]:
-            dx = planet.x - asteroid.x
-            dy = planet.y - asteroid.y
-            distance = math.sqrt(dx ** 2 + dy ** 2)
-            if distance < planet.radius + asteroid.radius:
-                if planet.mass + asteroid.mass != 0:
-                    planet.velocity_x = (planet.mass * planet.velocity_x + asteroid.mass * asteroid.velocity_x) / (planet.mass + asteroid.mass)
-                    planet.velocity_y = (planet.mass * planet.velocity_y + asteroid.mass * asteroid.velocity_y) / (planet.mass + asteroid.mass)
-                    planet.mass -= asteroid.mass
-                    asteroids.remove(asteroid)
+        # Released slots have zero velocity, so moving every slot leaves them in place
+        self.position += self.velocity
+        np.subtract(self.alpha, 0.4, out=self.alpha, where=self.alive)
+        np.less_equal(self.alpha, 0, out=self._dead)
+        self._dead &= self.alive
+        if self._dead.any():
+            slots = np.flatnonzero(self._dead)
+            self.velocity[slots] = 0
+            self.release(slots)
+
+# Expanding rings left by impacts, each one pushes the planets it reaches except the one that was hit
+class ShockwavePool(Pool):
+    def __init__(self, capacity=SHOCKWAVE_CAPACITY):
+        super().__init__(capacity)
+        self.position = np.zeros((capacity, 2))
+        self.radius = np.zeros(capacity)
+        self.expansion_speed = np.zeros(capacity)
+        self.alpha = np.zeros(capacity)
+        self.strength = np.zeros(capacity)
+        # Row of the planet that was hit and of the planet the asteroid was aimed at (-1 for none)
+        self.owner = np.full(capacity, -1)
+        self.creator = np.full(capacity, -1)
+
+    def emit(self, x, y, expansion_speed, initial_alpha, strength, owner, creator=-1):
+        slots = self.take(1)
+        self.position[slots] = (x, y)
+        self.radius[slots] = 0
+        self.expansion_speed[slots] = expansion_speed
+        self.alpha[slots] = initial_alpha
+        self.strength[slots] = strength
+        self.owner[slots] = owner
+        self.creator[slots] = creator
+
+    # Grow and fade every shockwave and push the planets inside them, the planets are rows 0..planets-1 of `bodies`
+    def update(self, bodies, planets):
+        alive = self.alive
+        self.radius += self.expansion_speed * alive
+        np.subtract(self.alpha, 0.1, out=self.alpha, where=alive)
+        np.subtract(self.strength, 0.1, out=self.strength, where=alive & (self.strength > 0))
+
+        slots = np.flatnonzero(alive)
+        if len(slots):
+            dx = bodies.position[:planets, 0] - self.position[slots, 0, None]
+            dy = bodies.position[:planets, 1] - self.position[slots, 1, None]
+            length = np.sqrt(dx ** 2 + dy ** 2)
+            distance = np.maximum(1, length)
+            # Direction of the push, along x when the planet sits right on the centre
+            safe = np.where(length > 0, length, 1)
+            dx, dy = np.where(length > 0, dx / safe, 1), np.where(length > 0, dy / safe, 0)
+            force = self.strength[slots, None] / distance
+            force[(distance >= self.radius[slots, None]) | (self.owner[slots, None] == np.arange(planets))] = 0
+            bodies.velocity[:planets, 0] += (force * dx).sum(axis=0)
+            bodies.velocity[:planets, 1] += (force * dy).sum(axis=0)
+
+        np.less_equal(self.alpha, 0, out=self._dead)
+        self._dead &= alive
+        if self._dead.any():
+            self.release(np.flatnonzero(self._dead))
+
+# The simulation without any drawing. Physics runs in fixed steps of `dt`; step() takes any elapsed
+# time and keeps the remainder in an accumulator, so the result does not depend on the frame rate.
+# All randomness comes from a generator seeded with `seed` (a random one when None), so a world is
+# reproduced exactly by its seed and the steps at which asteroids were launched.
+class World:
+    def __init__(self, solver=direct_gravity, dt=time_step, seed=None, integrator=INTEGRATOR, adaptive=True):
+        self.solver = solver
+        self.dt = dt
+        self.integrator = integrator
+        self.adaptive = adaptive
+        self.seed = random.randrange(2 ** 63) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        # EventLog recording the launches, if any
+        self.log = None
+        self.accumulator = 0
+        self.steps = 0
+        self.bodies = Bodies()
+        self.planets = [Planet(self.bodies, WIDTH // 3, HEIGHT // 2, 5000, 20, PLANET1_COLOR),
+                        Planet(self.bodies, 2 * WIDTH // 3, HEIGHT // 2, 7000, 25, PLANET2_COLOR)]
+        self.particles = ParticlePool(rng=self.rng)
+        self.shockwaves = ShockwavePool()
+        self.planets_hit_by_asteroid = []
+
+    @property
+    def time(self):
+        return self.steps * self.dt
+
+    # The solver and the log belong to the run, not to the state
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['solver'], state['log']
+        return state
+
+    # Compressed copy of the whole state
+    def checkpoint(self):
+        return zlib.compress(pickle.dumps(self, pickle.HIGHEST_PROTOCOL), 1)
+
+    @staticmethod
+    def from_checkpoint(data, solver=direct_gravity):
+        world = pickle.loads(zlib.decompress(data))
+        world.solver = solver
+        world.log = None
+        return world
+
+    # Asteroid dropped at (x, y), aimed at the planet it was launched over
+    def launch(self, x, y):
+        target = -1
+
+        # Which planet was hit by the asteroid
+        for planet in self.planets:
+            if planet.x - x < planet.radius and planet.y - y < planet.radius:
+                target = planet.index
+                break
+        if self.log is not None:
+            self.log.launch(self.steps, x, y)
+        return self.bodies.add(x, y, 100, 5, ASTEROID_COLOR, ASTEROID, target=target)
+
+    # Advance by `elapsed` seconds, returns the number of physics steps taken
+    def step(self, elapsed):
+        self.accumulator += elapsed
+        steps = 0
+        # A small tolerance keeps steps of exactly dt from being lost to rounding
+        while self.accumulator >= self.dt * (1 - 1e-9):
+            self.accumulator -= self.dt
+            self.tick()
+            steps += 1
+        return steps
+
+    # One physics step of length dt
+    def tick(self):
+        bodies, planets = self.bodies, self.planets
+
+        # Move planets and asteroids under gravity (planet to planet gravity is left out)
+        integrate(bodies, self.solver, self.dt, self.integrator, self.adaptive)
+        n = bodies.count
+        position, velocity = bodies.position[:n], bodies.velocity[:n]
+
+        # Handle screen boundaries for planets
+        for planet in planets:
+            if planet.x - planet.radius < 0:
+                planet.x = planet.radius
+                planet.velocity_x *= -0.7
+            elif planet.x + planet.radius > WIDTH:
+                planet.x = WIDTH - planet.radius
+                planet.velocity_x *= -0.7
+            if planet.y - planet.radius < 0:
+                planet.y = planet.radius
+                planet.velocity_y *= -0.7
+            elif planet.y + planet.radius > HEIGHT:
+                planet.y = HEIGHT - planet.radius
+                planet.velocity_y *= -0.7
+
+        # Handle screen boundaries for asteroids
+        asteroids = bodies.kind[:n] == ASTEROID
+        x, y, radius = position[:, 0], position[:, 1], bodies.radius[:n]
+        velocity[asteroids & ((x - radius < 0) | (x + radius > WIDTH)), 0] *= -0.7
+        velocity[asteroids & ((y - radius < 0) | (y + radius > HEIGHT)), 1] *= -0.7
+
+        # Collisions of all overlapping pairs found by the spatial hash
+        removed = np.zeros(n, dtype=bool)
+        first, second = collision_pairs(position, radius)
+        for i, j in zip(first.tolist(), second.tolist()):
+            # Planets come first in the store, so i is the planet of a mixed pair
+            if bodies.kind[i] == PLANET and bodies.kind[j] == PLANET:
+                collide_planets(planets[i], planets[j])
+
+            elif bodies.kind[i] == PLANET:
+                planet = planets[i]
+                asteroid_mass = bodies.mass[j]
+                asteroid_x, asteroid_y = position[j]
+                target = bodies.target[j]
+                if planet.mass + asteroid_mass != 0:
+                    planet.velocity_x = (planet.mass * planet.velocity_x + asteroid_mass * velocity[j, 0]) / (planet.mass + asteroid_mass)
+                    planet.velocity_y = (planet.mass * planet.velocity_y + asteroid_mass * velocity[j, 1]) / (planet.mass + asteroid_mass)
+                    planet.mass -= asteroid_mass
+                    removed[j] = True
 
                 # Explosion at the collision point
-                explosion = create_explosion(asteroid.x, asteroid.y)
-                explosions.append(explosion)
+                self.particles.emit(asteroid_x, asteroid_y)
 
                 # Shockwave at the collision point
-                shockwave = Shockwave(asteroid.x, asteroid.y, 80, 0.1, 255, 160, asteroid.target_planet)
-                planet.shockwaves.append(shockwave)
+                self.shockwaves.emit(asteroid_x, asteroid_y, 0.1, 255, 160, i, target)
 
-                planets_hit_by_asteroid.append(planet)
+                self.planets_hit_by_asteroid.append(planet)
                 # Remove the first planet in the list if there are two planets in it
-                if len(planets_hit_by_asteroid) > 1:
-                    planets_hit_by_asteroid.pop(0)
-
-    planets_hit_by_asteroid = list(set(planets_hit_by_asteroid))
-
-    # Update position of particles in explosion
-    for explosion in explosions:
-        for particle in explosion:
-            particle.move()
-        if all(particle.alpha <= 0 for particle in explosion):
-            explosions.remove(explosion)
-
-    # Update position of shockwaves for each planet
-    for planet in [planet1, planet2]:
-        for shockwave in planet.shockwaves:
-            shockwave.update()
-
-        # Iterate through the shockwaves associated with the current planet
-        for shockwave in planet.shockwaves:
-            for other_planet in [planet1, planet2]:
-                if other_planet != planet:
-                    dx = other_planet.x - shockwave.x
-                    dy = other_planet.y - shockwave.y
-                    distance = max(1, math.sqrt(dx ** 2 + dy ** 2))
-                    if distance < shockwave.current_radius:
-                        angle = math.atan2(dy, dx)
-                        force = shockwave.strength / distance
-                        other_planet.velocity_x += force * math.cos(angle)
-                        other_planet.velocity_y += force * math.sin(angle)
-
-        # Remove faded shockwaves from the list
-        planet.shockwaves = [shockwave for shockwave in planet.shockwaves if not shockwave.is_faded()]
-
-    # Clear the screen
-    screen.fill(BACKGROUND_COLOR)
-
-    # Drawing section
-    for planet in [planet1, planet2]:
-        for shockwave in planet.shockwaves:
-            if shockwave.current_radius > 0:
-                num_dots = 20
-                dot_radius = 1.5
-                for i in range(num_dots):
-                    angle = i * (2 * math.pi / num_dots)
-                    x_dot = shockwave.x + shockwave.current_radius * math.cos(angle)
-                    y_dot = shockwave.y + shockwave.current_radius * math.sin(angle)
-                    pygame.draw.circle(screen, (0, 255, 255, shockwave.current_alpha), (int(x_dot), int(y_dot)), dot_radius)
-
-        # Check if any shockwaves have faded completely and remove them from the list
-        planet.shockwaves = [shockwave for shockwave in planet.shockwaves if not shockwave.is_faded()]
-
-    pygame.draw.circle(screen, planet1.color, (int(planet1.x), int(planet1.y)), planet1.radius)
-    pygame.draw.circle(screen, planet2.color, (int(planet2.x), int(planet2.y)), planet2.radius)
-    for asteroid in asteroids:
-        pygame.draw.circle(screen, asteroid.color, (int(asteroid.x), int(asteroid.y)), asteroid.radius)
-
-    for explosion in explosions:
-        for particle in explosion:
-            pygame.draw.circle(screen, particle.color + (particle.alpha,), (int(particle.x), int(particle.y)), particle.size)
-
-    # Check if all particles in each explosion have faded and remove the finished explosions
-    explosions = [explosion for explosion in explosions if not all(particle.alpha <= 0 for particle in explosion)]
-
-    pygame.display.flip()
\ No newline at end of file
+                if len(self.planets_hit_by_asteroid) > 1:
+                    self.planets_hit_by_asteroid.pop(0)
+
+            elif ASTEROID_MERGING and not removed[i] and not removed[j]:
+                merge_asteroids(bodies, i, j)
+                removed[j] = True
+
+        if removed.any():
+            bodies.remove(removed)
+        self.planets_hit_by_asteroid = list(set(self.planets_hit_by_asteroid))
+
+        # Update the particles of explosions and the shockwaves
+        self.particles.update()
+        self.shockwaves.update(bodies, len(planets))
+
+        self.steps += 1
+
+# Writes the launches of a world to a binary input log as they happen
+class EventLog:
+    def __init__(self, path, world, solver_name, theta=THETA):
+        self.file = open(path, 'wb')
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC, world.seed, world.dt, solver_name.encode(), theta,
+                                        world.integrator.encode(), world.adaptive))
+        world.log = self
+
+    def launch(self, step, x, y):
+        self.file.write(LOG_EVENT.pack(step, x, y))
+
+    def close(self, step):
+        self.file.write(LOG_EVENT.pack(step, math.nan, math.nan))
+        self.file.close()
+
+# Header fields, launches (a structured array of step, x, y) and the last step of an input log
+def read_log(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, seed, dt, solver_name, theta, integrator, adaptive = LOG_HEADER.unpack_from(data)
+    if magic != LOG_MAGIC:
+        raise ValueError(f'{path} is not an input log')
+    events = np.frombuffer(data, np.dtype([('step', '<u4'), ('x', '<f8'), ('y', '<f8')]), offset=LOG_HEADER.size)
+    end = np.isnan(events['x'])
+    # A log cut short by a crash ends with its last launch
+    last = int(events['step'][end][-1]) if end.any() else int(events['step'][-1]) if len(events) else 0
+    header = {'seed': seed, 'dt': dt, 'solver': solver_name.rstrip(b'\0').decode(), 'theta': theta,
+              'integrator': integrator.rstrip(b'\0').decode(), 'adaptive': adaptive}
+    return header, events[~end], last
+
+# Fingerprint of an input log, stored with the replay checkpoints taken from it
+def log_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+# Rebuild the world of an input log as it was after `step` steps (default the end of the recording)
+# without drawing anything. The run starts from the latest of `checkpoints` ({step: data}) that is not
+# past `step`, and a new checkpoint is added every `every` steps.
+def replay(path, step=None, checkpoints=None, every=CHECKPOINT_INTERVAL):
+    header, events, last = read_log(path)
+    solver = make_solver(header['solver'], header['theta'])
+    step = last if step is None else step
+    checkpoints = {} if checkpoints is None else checkpoints
+    start = max((s for s in checkpoints if s <= step), default=None)
+    if start is None:
+        world = World(solver, header['dt'], header['seed'], header['integrator'], header['adaptive'])
+    else:
+        world = World.from_checkpoint(checkpoints[start], solver)
+
+    # Launches at a step happen after that step's checkpoint was taken and before the next tick
+    k = np.searchsorted(events['step'], world.steps, 'left')
+    while world.steps < step:
+        while k < len(events) and events['step'][k] == world.steps:
+            world.launch(float(events['x'][k]), float(events['y'][k]))
+            k += 1
+        world.tick()
+        if world.steps % every == 0:
+            checkpoints[world.steps] = world.checkpoint()
+    return world
+
+# Draws a World in layers, each layer is one Surface.blits call of cached circle sprites. Sprites carry
+# real per pixel alpha; particle colours and the opacity of particles and shockwaves are rounded to
+# ALPHA_LEVELS steps so that a few hundred sprites cover every case. The time of every layer in the last
+# frame is kept in `last` and as a moving average in `timings` (milliseconds).
+class Renderer:
+    # Positions of the dots on a shockwave ring of radius 1
+    DOTS = 20
+    UNIT_CIRCLE = np.stack((np.cos(np.arange(DOTS) * 2 * math.pi / DOTS), np.sin(np.arange(DOTS) * 2 * math.pi / DOTS)), axis=1)
+    DOT_RADIUS = 1.5
+    SHOCKWAVE_COLOR = (0, 255, 255)
+    ALPHA_LEVELS = 32
+    COLOR_STEP = 16
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.sprites = {}
+        self.last = {}
+        self.timings = {}
+        self.font = None
+
+    def sprite(self, radius, color, alpha=255):
+        key = (radius, color, alpha)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            size = 2 * math.ceil(radius) + 1
+            sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color + (alpha,), (size // 2, size // 2), radius)
+            self.sprites[key] = sprite
+        return sprite
+
+    # Opacities 0-255 rounded up to one of the alpha levels
+    def _alpha(self, alpha):
+        step = 256 // self.ALPHA_LEVELS
+        return np.minimum(255, np.ceil(np.clip(alpha, 1, 255) / step) * step).astype(int).tolist()
+
+    def _time(self, layer, start):
+        now = time.perf_counter()
+        elapsed = self.last[layer] = (now - start) * 1000
+        self.timings[layer] = 0.9 * self.timings.get(layer, elapsed) + 0.1 * elapsed
+        return now
+
+    def draw(self, world):
+        start = time.perf_counter()
+        # Clear the screen
+        self.screen.fill(BACKGROUND_COLOR)
+        start = self._time('clear', start)
+
+        # Every dot of every shockwave from the unit circle table
+        shockwaves = world.shockwaves
+        slots = np.flatnonzero(shockwaves.alive & (shockwaves.radius > 0))
+        if len(slots):
+            offset = math.ceil(self.DOT_RADIUS)
+            dots = shockwaves.position[slots, None] + shockwaves.radius[slots, None, None] * self.UNIT_CIRCLE
+            corner = (dots.reshape(-1, 2).astype(int) - offset).tolist()
+            alpha = np.repeat(self._alpha(shockwaves.alpha[slots]), self.DOTS).tolist()
+            self.screen.blits([(self.sprite(self.DOT_RADIUS, self.SHOCKWAVE_COLOR, a), xy) for a, xy in zip(alpha, corner)], False)
+        start = self._time('shockwaves', start)
+
+        # Planets and asteroids
+        bodies = world.bodies
+        n = bodies.count
+        radius = bodies.radius[:n].astype(int)
+        corner = (bodies.position[:n].astype(int) - radius[:, None]).tolist()
+        colors = [planet.color for planet in world.planets] + [tuple(color) for color in bodies.color[len(world.planets):n].tolist()]
+        self.screen.blits([(self.sprite(r, color), xy) for r, color, xy in zip(radius.tolist(), colors, corner)], False)
+        start = self._time('bodies', start)
+
+        particles = world.particles
+        slots = np.flatnonzero(particles.alive)
+        if len(slots):
+            size = particles.size[slots]
+            corner = (particles.position[slots].astype(int) - size[:, None]).tolist()
+            color = (particles.color[slots] // self.COLOR_STEP * self.COLOR_STEP).tolist()
+            alpha = self._alpha(particles.alpha[slots])
+            self.screen.blits([(self.sprite(s, tuple(c), a), xy) for s, c, a, xy in zip(size.tolist(), color, alpha, corner)], False)
+        self._time('particles', start)
+
+    # Frame time breakdown in the top left corner
+    def draw_timings(self, extra=()):
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 20)
+        items = list(extra) + list(self.timings.items())
+        text = '  '.join(f'{layer} {ms:.2f}' for layer, ms in items) + ' ms'
+        self.screen.blit(self.font.render(text, True, (200, 200, 200)), (5, 5))
+
+# Window showing the world in real time, clicks launch asteroids and T toggles the frame time breakdown
+def view(world, fps=frame_rate):
+    if pygame is None:
+        sys.exit('The viewer needs pygame, use --headless to run without it')
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Planetary Motion and Asteroid Impact")
+    clock = pygame.time.Clock()
+    renderer = Renderer(screen)
+    show_timings = True
+    physics = flip = 0
+
+    # Main simulation loop
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                world.launch(*event.pos)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+                show_timings = not show_timings
+
+        start = time.perf_counter()
+        world.step(min(clock.tick(fps) / 1000, MAX_FRAME_TIME))
+        physics = 0.9 * physics + 0.1 * (time.perf_counter() - start) * 1000
+        renderer.draw(world)
+        if show_timings:
+            renderer.draw_timings([('physics', physics), ('flip', flip)])
+        start = time.perf_counter()
+        pygame.display.flip()
+        flip = 0.9 * flip + 0.1 * (time.perf_counter() - start) * 1000
+
+# Average time of every drawing layer over `frames` frames rendered off screen
+def benchmark_render(world, frames=200):
+    if pygame is None:
+        sys.exit('Rendering needs pygame')
+    renderer = Renderer(pygame.Surface((WIDTH, HEIGHT), depth=32))
+    totals = {}
+    for _ in range(frames):
+        world.step(world.dt)
+        renderer.draw(world)
+        for layer, ms in renderer.last.items():
+            totals[layer] = totals.get(layer, 0) + ms
+    print(f'{world.bodies.count} bodies, {len(world.particles)} particles, {len(world.shockwaves)} shockwaves')
+    for layer, total in totals.items():
+        print(f'{layer:>10} {total / frames:8.3f} ms')
+
+# Run the world without a window for `seconds` of simulated time and report the speed
+def run_headless(world, seconds):
+    start = time.perf_counter()
+    steps = world.step(seconds)
+    elapsed = time.perf_counter() - start
+    print(f'{steps} steps ({seconds:g} s simulated) in {elapsed:.3f} s, '
+          f'{steps / elapsed:.0f} steps/s, {seconds / elapsed:.0f}x real time')
+    for planet in world.planets:
+        print(f'planet {planet.index}: x={planet.x:.3f} y={planet.y:.3f} mass={planet.mass:g}')
+    print(f'{world.bodies.count - len(world.planets)} asteroids left')
+
+# Command line
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Planetary motion and asteroid impacts.')
+    parser.add_argument('--solver', choices=sorted(SOLVERS), default='direct', help='gravity solver (default direct)')
+    parser.add_argument('--theta', type=float, default=THETA, help='opening angle of the Barnes-Hut solver')
+    parser.add_argument('--bench-gravity', action='store_true', help='compare the gravity solvers and exit')
+    parser.add_argument('--integrator', choices=list(INTEGRATORS), default=INTEGRATOR, help=f'integrator (default {INTEGRATOR})')
+    parser.add_argument('--no-substeps', action='store_true', help='no adaptive substeps for close encounters')
+    parser.add_argument('--dt', type=float, default=time_step, help='physics time step in seconds')
+    parser.add_argument('--bench-integrators', action='store_true', help='compare the energy drift of the integrators and exit')
+    parser.add_argument('--headless', type=float, metavar='SECONDS', help='simulate this long without a window and exit')
+    parser.add_argument('--asteroids', type=int, default=0, help='asteroids launched at random places at the start')
+    parser.add_argument('--fps', type=int, default=frame_rate, help='frame rate of the viewer')
+    parser.add_argument('--bench-render', type=int, metavar='FRAMES', help='time the drawing layers off screen and exit')
+    parser.add_argument('--seed', type=int, help='seed of the random generator (default random)')
+    parser.add_argument('--record', metavar='LOG', help='record the launched asteroids to an input log')
+    parser.add_argument('--replay', metavar='LOG', help='re-run an input log without a window as fast as possible')
+    parser.add_argument('--seek', type=int, metavar='STEP', help='stop the replay after this step')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_INTERVAL, metavar='STEPS',
+                        help='steps between replay checkpoints (default %(default)s)')
+    args = parser.parse_args()
+    if args.bench_gravity:
+        benchmark_gravity()
+        sys.exit()
+    if args.bench_integrators:
+        benchmark_integrators()
+        sys.exit()
+
+    if args.replay:
+        # Checkpoints of earlier replays of the same log are kept next to it, with the digest of the log
+        # they came from so that a new recording to the same path does not resume from stale states
+        checkpoint_path = args.replay + '.ckpt'
+        digest = log_digest(args.replay)
+        try:
+            with open(checkpoint_path, 'rb') as f:
+                saved = pickle.load(f)
+            checkpoints = saved['checkpoints'] if saved.get('log') == digest else {}
+        except FileNotFoundError:
+            checkpoints = {}
+        start = time.perf_counter()
+        world = replay(args.replay, args.seek, checkpoints, args.checkpoint_every)
+        elapsed = time.perf_counter() - start
+        with open(checkpoint_path, 'wb') as f:
+            pickle.dump({'log': digest, 'checkpoints': checkpoints}, f, pickle.HIGHEST_PROTOCOL)
+        print(f'replayed to step {world.steps} in {elapsed:.3f} s, {len(checkpoints)} checkpoints')
+        for planet in world.planets:
+            print(f'planet {planet.index}: x={planet.x:.3f} y={planet.y:.3f} mass={planet.mass:g}')
+        print(f'{world.bodies.count - len(world.planets)} asteroids left')
+        sys.exit()
+
+    world = World(make_solver(args.solver, args.theta), args.dt, args.seed, args.integrator, not args.no_substeps)
+    if args.record:
+        EventLog(args.record, world, args.solver, args.theta)
+    # The start positions come from a generator of their own: a replay reads them from the log and
+    # must leave the world's generator in the same state as the recording did
+    spawn = random.Random(f'{world.seed}:asteroids')
+    for _ in range(args.asteroids):
+        world.launch(spawn.uniform(0, WIDTH), spawn.uniform(0, HEIGHT))
+    if args.bench_render:
+        benchmark_render(world, args.bench_render)
+    elif args.headless is not None:
+        run_headless(world, args.headless)
+    else:
+        view(world, args.fps)
+    if world.log is not None:
+        world.log.close(world.steps)
@@ -1,25 +1,620 @@
 """
 This is a program for solving Sudoku.
 
-Algorithm used for the solving is Depth-first search with backtracking.
+Three solving engines are available: the original depth-first search with backtracking,
+constraint propagation over candidate bitmasks (the default) and Dancing Links exact cover.
+Boards of any box size are supported (9x9, 16x16, 25x25, ...).
 
 The program contains GUI with a Solve button which solves the initial board.
 """
 
 # Library used for GUI
 import tkinter as tk
+import argparse
+import collections
+import functools
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Cells of a board with boxes of box x box cells are numbered row by row. The tables give the row,
+# column and box of every cell, and the cells of every unit (rows first, then columns, then boxes).
+@functools.lru_cache(maxsize=None)
+def board_tables(box):
+    size = box * box
+    cells = range(size * size)
+    row_of = [cell // size for cell in cells]
+    col_of = [cell % size for cell in cells]
+    box_of = [(cell // size) // box * box + (cell % size) // box for cell in cells]
+    units = [[cell for cell in cells if row_of[cell] == i] for i in range(size)]
+    units += [[cell for cell in cells if col_of[cell] == i] for i in range(size)]
+    units += [[cell for cell in cells if box_of[cell] == i] for i in range(size)]
+    return row_of, col_of, box_of, units
+
+
+# Depth-first search with backtracking, fills `grid` (a list of rows with None for empty cells) in place.
+# Returns True if the puzzle was solved, otherwise the grid is left as it was.
+def solve_dfs(grid):
+    size = len(grid)
+    box = math.isqrt(size)
+
+    # Define a helper function to check if a number is valid in a given position
+    def is_valid(num, row, col):
+        # Check row
+        for i in range(size):
+            if grid[row][i] == num:
+                return False
+        # Check column
+        for i in range(size):
+            if grid[i][col] == num:
+                return False
+        # Check box
+        box_row = (row // box) * box
+        box_col = (col // box) * box
+        for i in range(box):
+            for j in range(box):
+                if grid[box_row+i][box_col+j] == num:
+                    return False
+        return True
+
+    # Define a helper function to find the next empty cell
+    def find_empty_cell():
+        for i in range(size):
+            for j in range(size):
+                if grid[i][j] == None:
+                    return (i, j)
+        return None
+
+    # Use recursion to solve the puzzle
+    def solve_helper():
+        empty_cell = find_empty_cell()
+        # If there are no empty cells, the puzzle is solved
+        if not empty_cell:
+            return True
+        row, col = empty_cell
+        # Try each possible value for the empty cell
+        for num in range(1, size + 1):
+            if is_valid(num, row, col):
+                grid[row][col] = num
+                # Recursively solve the puzzle with the new number in place
+                if solve_helper():
+                    return True
+                # If the new number leads to an unsolvable puzzle, backtrack and try a different number
+                grid[row][col] = None
+        # If no valid number can be placed in the empty cell, backtrack and try a different value for the previous empty cell
+        return False
+
+    return solve_helper()
+
+
+# Constraint propagation over candidate bitmasks, fills `grid` in place like solve_dfs.
+# Every row, column and box keeps a mask of its placed digits (bit d-1 for digit d), so the candidates
+# of a cell are the bits missing from all three of its units. Naked singles (a cell with one candidate)
+# and hidden singles (a digit with one place left in a unit) are placed until nothing changes, then
+# the search branches on the empty cell with the fewest candidates (MRV). Placements go on a trail,
+# so backtracking only clears the cells placed since the branch.
+def solve_bitmask(grid):
+    steps = bitmask_steps(grid)
+    try:
+        while True:
+            next(steps)
+    except StopIteration as done:
+        return done.value > 0
+
+
+# solve_bitmask one branch at a time: the generator yields the placed digits of every cell (as bits,
+# 0 for empty) at each branch of the search. The search goes on until `limit` solutions were found;
+# the generator returns how many it found and fills `grid` with the first one.
+def bitmask_steps(grid, limit=1):
+    size = len(grid)
+    row_of, col_of, box_of, units = board_tables(math.isqrt(size))
+    full = (1 << size) - 1
+    # Unit masks: rows, then columns, then boxes, in the order of `units`
+    used = [0] * (3 * size)
+    # Placed digit of every cell as a bit, 0 for empty
+    values = [0] * (size * size)
+    trail = []
+    solutions = []
+
+    def place(cell, bit):
+        values[cell] = bit
+        used[row_of[cell]] |= bit
+        used[size + col_of[cell]] |= bit
+        used[2 * size + box_of[cell]] |= bit
+        trail.append(cell)
+
+    # Take back every placement after the first `mark` ones
+    def undo(mark):
+        while len(trail) > mark:
+            cell = trail.pop()
+            bit = ~values[cell]
+            values[cell] = 0
+            used[row_of[cell]] &= bit
+            used[size + col_of[cell]] &= bit
+            used[2 * size + box_of[cell]] &= bit
+
+    def candidates(cell):
+        return full & ~(used[row_of[cell]] | used[size + col_of[cell]] | used[2 * size + box_of[cell]])
+
+    # Place naked and hidden singles until none are left, False on a contradiction
+    def propagate():
+        changed = True
+        while changed:
+            changed = False
+            # Naked singles
+            for cell in range(size * size):
+                if not values[cell]:
+                    mask = candidates(cell)
+                    if not mask:
+                        return False
+                    if not mask & (mask - 1):
+                        place(cell, mask)
+                        changed = True
+            # Hidden singles
+            for unit, cells in enumerate(units):
+                once = twice = 0
+                for cell in cells:
+                    if not values[cell]:
+                        mask = candidates(cell)
+                        twice |= once & mask
+                        once |= mask
+                # A digit that is neither placed nor possible anywhere in the unit
+                if once | used[unit] != full:
+                    return False
+                singles = once & ~twice
+                while singles:
+                    bit = singles & -singles
+                    singles ^= bit
+                    for cell in cells:
+                        if not values[cell] and candidates(cell) & bit:
+                            place(cell, bit)
+                            changed = True
+                            break
+                    else:
+                        # The only place was taken by another single of this unit
+                        return False
+        return True
+
+    # Minimum remaining values: the empty cell with the fewest candidates, None when the board is full
+    def choose():
+        best, best_count = None, size + 1
+        for cell in range(size * size):
+            if not values[cell]:
+                count = bin(candidates(cell)).count('1')
+                if count < best_count:
+                    best, best_count = cell, count
+                    if count == 2:
+                        break
+        return best
+
+    # Depth-first search on an explicit stack so large boards do not hit the recursion limit. Every
+    # open branch is [trail length before and after its propagation, branching cell, untried digits].
+    def search():
+        stack = []
+        entering = True
+        while True:
+            if entering:
+                mark = len(trail)
+                if propagate():
+                    yield values
+                    best = choose()
+                    if best is None:
+                        solutions.append(values[:])
+                        if len(solutions) >= limit:
+                            return
+                        undo(mark)
+                    else:
+                        stack.append([mark, len(trail), best, candidates(best)])
+                else:
+                    undo(mark)
+            # Next digit of the innermost branch that has one left
+            entering = False
+            while stack:
+                mark, branch, best, mask = frame = stack[-1]
+                undo(branch)
+                if mask:
+                    bit = mask & -mask
+                    frame[3] = mask ^ bit
+                    place(best, bit)
+                    entering = True
+                    break
+                undo(mark)
+                stack.pop()
+            if not entering:
+                return
+
+    # Givens, a digit repeated in a unit makes the puzzle unsolvable
+    for i, row in enumerate(grid):
+        for j, value in enumerate(row):
+            if value:
+                cell = i * size + j
+                bit = 1 << (value - 1)
+                if candidates(cell) & bit == 0:
+                    return 0
+                place(cell, bit)
+    yield from search()
+    if solutions:
+        for cell, bit in enumerate(solutions[0]):
+            grid[cell // size][cell % size] = bit.bit_length()
+    return len(solutions)
+
+
+# Algorithm X with Dancing Links on the exact cover form of the board, fills `grid` in place like
+# solve_dfs. Every (cell, digit) choice is a row covering four columns: the cell is filled, and the
+# digit appears in its row, column and box. Only choices the givens allow become rows. The links live in flat lists indexed by node number
+# (node 0 is the root, nodes 1..columns are the column headers) instead of one object per node, and
+# the search runs on an explicit stack so large boards do not hit the recursion limit.
+def solve_dlx(grid):
+    size = len(grid)
+    row_of, col_of, box_of, units = board_tables(math.isqrt(size))
+    cells = size * size
+    columns = 4 * cells
+    # Headers link to themselves vertically, the root and headers form one horizontal ring
+    left = [i - 1 for i in range(columns + 1)]
+    right = [i + 1 for i in range(columns + 1)]
+    left[0], right[columns] = columns, 0
+    up = list(range(columns + 1))
+    down = list(range(columns + 1))
+    column = list(range(columns + 1))
+    count = [0] * (columns + 1)
+    # Choice (cell * size + digit - 1) of every node, -1 for the headers
+    choice = [-1] * (columns + 1)
+
+    # Digits placed in every row, column and box; a digit given twice in a unit makes the puzzle unsolvable
+    used = [0] * (3 * size)
+    givens = {}
+    for i, row in enumerate(grid):
+        for j, value in enumerate(row):
+            if value:
+                cell = i * size + j
+                bit = 1 << (value - 1)
+                units_of_cell = (row_of[cell], size + col_of[cell], 2 * size + box_of[cell])
+                if any(used[unit] & bit for unit in units_of_cell):
+                    return False
+                for unit in units_of_cell:
+                    used[unit] |= bit
+                givens[cell] = value - 1
+
+    # First node of the row of every given
+    given_nodes = []
+    for cell in range(cells):
+        if cell in givens:
+            digits = [givens[cell]]
+        else:
+            taken = used[row_of[cell]] | used[size + col_of[cell]] | used[2 * size + box_of[cell]]
+            digits = [d for d in range(size) if not taken >> d & 1]
+        for d in digits:
+            first = len(column)
+            if cell in givens:
+                given_nodes.append(first)
+            for c in (1 + cell,
+                      1 + cells + row_of[cell] * size + d,
+                      1 + 2 * cells + col_of[cell] * size + d,
+                      1 + 3 * cells + box_of[cell] * size + d):
+                node = len(column)
+                column.append(c)
+                choice.append(cell * size + d)
+                # Append the node at the bottom of its column and at the end of its row
+                up.append(up[c])
+                down.append(c)
+                down[up[c]] = node
+                up[c] = node
+                count[c] += 1
+                left.append(node - 1 if node > first else node + 3)
+                right.append(node + 1 if node < first + 3 else first)
+
+    def cover(c):
+        right[left[c]], left[right[c]] = right[c], left[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                down[up[j]], up[down[j]] = down[j], up[j]
+                count[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(c):
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                count[column[j]] += 1
+                down[up[j]] = up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[c]] = left[right[c]] = c
+
+    # The givens are chosen up front
+    for node in given_nodes:
+        for k in range(4):
+            cover(column[node + k])
+
+    # Chosen row node at every depth of the search
+    path = []
+    forward = True
+    while True:
+        if forward:
+            if right[0] == 0:
+                break
+            # The column with the fewest rows left
+            c, best = right[0], count[right[0]]
+            j = right[c]
+            while j != 0 and best > 1:
+                if count[j] < best:
+                    c, best = j, count[j]
+                j = right[j]
+            cover(c)
+            r = down[c]
+        else:
+            if not path:
+                return False
+            # Take back the last choice and move on to the next row of its column
+            r = path.pop()
+            j = left[r]
+            while j != r:
+                uncover(column[j])
+                j = left[j]
+            c = column[r]
+            r = down[r]
+        if r == c:
+            # No rows left in this column
+            uncover(c)
+            forward = False
+            continue
+        path.append(r)
+        j = right[r]
+        while j != r:
+            cover(column[j])
+            j = right[j]
+        forward = True
+
+    for node in path:
+        cell, d = divmod(choice[node], size)
+        grid[cell // size][cell % size] = d + 1
+    return True
+
+
+# Number of solutions of `grid`, counting stops at `limit`. The grid itself is not changed.
+def count_solutions(grid, limit=2):
+    steps = bitmask_steps([row[:] for row in grid], limit)
+    try:
+        while True:
+            next(steps)
+    except StopIteration as done:
+        return done.value
+
+
+# Techniques a person needs for a puzzle, from the easiest: hidden singles (the only place left for a
+# digit in a row, column or box), naked singles (the only digit left for a cell) and guessing
+TECHNIQUES = ('hidden singles', 'naked singles', 'guessing')
+
+# Clues left in a generated puzzle of each difficulty and the range of TECHNIQUES it may need; 0 clues
+# removes clues for as long as the solution stays unique (usually 22-26 clues on a 9x9 board)
+DIFFICULTIES = {'easy': (36, 0, 0), 'medium': (30, 1, 1), 'hard': (26, 2, 2), 'expert': (0, 2, 2)}
+# Boards tried before generate_puzzle gives up on a difficulty, medium takes about 15 on a 9x9 board
+GENERATE_ATTEMPTS = 1000
+
+
+# How hard `grid` (0 or None for empty) is to solve by hand. Every round places all hidden singles, or
+# all naked singles when there are none; when neither is left the cell with the fewest candidates is
+# guessed, lowest digit first. Returns the hardest technique needed (an index into TECHNIQUES), the
+# number of rounds and the number of guesses that had to be taken back.
+def rate_puzzle(grid):
+    size = len(grid)
+    row_of, col_of, box_of, units = board_tables(math.isqrt(size))
+    full = (1 << size) - 1
+    hardest = rounds = backtracks = 0
+
+    def place(values, used, cell, bit):
+        values[cell] = bit
+        used[row_of[cell]] |= bit
+        used[size + col_of[cell]] |= bit
+        used[2 * size + box_of[cell]] |= bit
+
+    def candidates(used, cell):
+        return full & ~(used[row_of[cell]] | used[size + col_of[cell]] | used[2 * size + box_of[cell]])
+
+    # Rounds of singles, then guesses on copies of the state; whether the board was solved
+    def solve(values, used):
+        nonlocal hardest, rounds, backtracks
+        while True:
+            rounds += 1
+            placed = False
+            for unit, cells in enumerate(units):
+                once = twice = 0
+                for cell in cells:
+                    if not values[cell]:
+                        mask = candidates(used, cell)
+                        twice |= once & mask
+                        once |= mask
+                if once | used[unit] != full:
+                    return False
+                singles = once & ~twice
+                while singles:
+                    bit = singles & -singles
+                    singles ^= bit
+                    for cell in cells:
+                        if not values[cell] and candidates(used, cell) & bit:
+                            place(values, used, cell, bit)
+                            placed = True
+                            break
+                    else:
+                        return False
+            if placed:
+                continue
+            for cell in range(size * size):
+                if not values[cell]:
+                    mask = candidates(used, cell)
+                    if not mask:
+                        return False
+                    if not mask & (mask - 1):
+                        place(values, used, cell, mask)
+                        placed = True
+            if not placed:
+                break
+            hardest = max(hardest, 1)
+        empty = [cell for cell in range(size * size) if not values[cell]]
+        if not empty:
+            return True
+        hardest = 2
+        best = min(empty, key=lambda cell: bin(candidates(used, cell)).count('1'))
+        mask = candidates(used, best)
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            guess_values, guess_used = values[:], used[:]
+            place(guess_values, guess_used, best, bit)
+            if solve(guess_values, guess_used):
+                return True
+            backtracks += 1
+        return False
+
+    values, used = [0] * (size * size), [0] * (3 * size)
+    for cell in range(size * size):
+        value = grid[cell // size][cell % size]
+        if value:
+            place(values, used, cell, 1 << (value - 1))
+    solve(values, used)
+    return hardest, rounds, backtracks
+
+
+# Puzzle with exactly one solution. A random complete board (the diagonal boxes, which do not see each
+# other, filled with random permutations and the rest solved) loses clues in random order, and a clue
+# is put back when removing it would allow a second solution. Boards whose puzzle needs techniques
+# outside the range of the difficulty are thrown away, ValueError after GENERATE_ATTEMPTS of them.
+# Returns the puzzle and its solution (lists of rows, 0 for empty) and its rate_puzzle rating.
+def generate_puzzle(difficulty='medium', seed=None, box=3):
+    rng = random.Random(seed)
+    size = box * box
+    target, easiest, hardest = DIFFICULTIES[difficulty]
+    for _ in range(GENERATE_ATTEMPTS):
+        solution = [[0] * size for _ in range(size)]
+        for b in range(box):
+            digits = rng.sample(range(1, size + 1), size)
+            for k, digit in enumerate(digits):
+                solution[b * box + k // box][b * box + k % box] = digit
+        solve_bitmask(solution)
+
+        puzzle = [row[:] for row in solution]
+        clues = size * size
+        for cell in rng.sample(range(size * size), size * size):
+            if clues <= target:
+                break
+            i, j = divmod(cell, size)
+            puzzle[i][j] = 0
+            if count_solutions(puzzle) == 1:
+                clues -= 1
+            else:
+                puzzle[i][j] = solution[i][j]
+
+        rating = rate_puzzle(puzzle)
+        if easiest <= rating[0] <= hardest:
+            return puzzle, solution, rating
+    raise ValueError(f'no {difficulty} puzzle in {GENERATE_ATTEMPTS} boards of box size {box}')
+
+
+# Worker of generate_file: puzzle `index` of a run as an 81 character line with its clues and rating
+def _generate_line(index, difficulty, seed, box):
+    # Every puzzle has its own seed, so the output does not depend on the number of workers
+    puzzle, solution, rating = generate_puzzle(difficulty, f'{seed}:{index}', box)
+    line = ''.join(str(value) if value else '.' for row in puzzle for value in row)
+    clues = sum(1 for row in puzzle for value in row if value)
+    return line, clues, rating
+
+
+# Write `count` unique-solution puzzles to `target` (- for stdout), one line each in input order,
+# generated on `workers` processes. Every puzzle and the rate are logged to stderr.
+def generate_file(count, target='-', difficulty='medium', seed=0, workers=None, box=3):
+    workers = workers or os.cpu_count() or 1
+    jobs = range(count)
+    args = (itertools.repeat(difficulty), itertools.repeat(seed), itertools.repeat(box))
+    out = sys.stdout if target == '-' else open(target, 'w')
+    start = time.perf_counter()
+    needed = collections.Counter()
+    try:
+        if workers == 1:
+            results = map(_generate_line, jobs, *args)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(workers)
+            results = executor.map(_generate_line, jobs, *args, chunksize=max(1, min(16, count // (4 * workers))))
+        for index, (line, clues, (technique, rounds, backtracks)) in enumerate(results):
+            out.write(line + '\n')
+            needed[TECHNIQUES[technique]] += 1
+            print(f'puzzle {index}: {clues} clues, needs {TECHNIQUES[technique]}, {rounds} rounds, '
+                  f'{backtracks} backtracks', file=sys.stderr)
+        if executor is not None:
+            executor.shutdown()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f'{count} {difficulty} puzzles in {elapsed:.2f} s, {count / elapsed:.1f} puzzles/s, '
+          + ', '.join(f'{needed[name]} need {name}' for name in TECHNIQUES), file=sys.stderr)
+
+
+# Solving engines selectable in SudokuGrid, and the ones that can also be run step by step
+SOLVERS = {'bitmask': solve_bitmask, 'dlx': solve_dlx, 'dfs': solve_dfs}
+STEPPERS = {'bitmask': bitmask_steps}
+
+
+# Random complete board with boxes of box x box cells: a valid pattern with its digits, bands, stacks
+# and the rows and columns inside them shuffled
+def random_solution(box, rng=random):
+    size = box * box
+    def shuffled(n):
+        return rng.sample(range(n), n)
+    rows = [band * box + r for band in shuffled(box) for r in shuffled(box)]
+    cols = [stack * box + c for stack in shuffled(box) for c in shuffled(box)]
+    digits = [d + 1 for d in shuffled(size)]
+    return [[digits[(box * (r % box) + r // box + c) % size] for c in cols] for r in rows]
+
+
+# Time every engine on `count` random puzzles per box size, made by emptying the fraction `holes[box]`
+# of the cells of a random solution. Around 40-50% holes large boards get very hard for every engine, so
+# the defaults stay below that. Engines are skipped on boards larger than their entry in `limits`.
+def benchmark(boxes=(3, 4, 5), count=5, holes={3: 0.6, 4: 0.5, 5: 0.4}, limits={'dfs': 9}, seed=0):
+    rng = random.Random(seed)
+    print(f'{"board":>7} ' + ' '.join(f'{name:>12}' for name in SOLVERS))
+    for box in boxes:
+        size = box * box
+        puzzles = []
+        for _ in range(count):
+            puzzle = random_solution(box, rng)
+            for cell in rng.sample(range(size * size), int(holes.get(box, 0.5) * size * size)):
+                puzzle[cell // size][cell % size] = 0
+            puzzles.append(puzzle)
+        times = []
+        for name in SOLVERS:
+            if size > limits.get(name, size):
+                times.append(f'{"-":>12}')
+                continue
+            start = time.perf_counter()
+            for puzzle in puzzles:
+                SudokuGrid(puzzle, name).solve()
+            times.append(f'{(time.perf_counter() - start) / count * 1000:9.2f} ms')
+        print(f'{size:>3}x{size:<3} ' + ' '.join(times))
 
 # A class representing the Sudoku grid
 class SudokuGrid:
-    def __init__(self, initial_numbers):
+    def __init__(self, initial_numbers, solver='bitmask'):
+        # Name of the engine used by solve(), one of SOLVERS
+        self.solver = solver
         # Initialize an empty grid
         self.grid = []
         # Iterate over each row in the grid
-        for i in range(9):
+        for i in range(len(initial_numbers)):
             # Initialize an empty list to represent the row
             row = []
             # Iterate over each cell in the row
-            for j in range(9):
+            for j in range(len(initial_numbers)):
                 # If the cell contains an initial number, add it to the row
                 if initial_numbers[i][j] == 0:
                     row.append(None)
@@ -38,63 +633,121 @@ class SudokuGrid:
 
     # Solve the sodoku board
     def solve(self):
-        # Define a helper function to check if a number is valid in a given position
-        def is_valid(num, row, col):
-            # Check row
-            for i in range(9):
-                if self.grid[row][i] == num:
-                    return False
-            # Check column
-            for i in range(9):
-                if self.grid[i][col] == num:
-                    return False
-            # Check box
-            box_row = (row // 3) * 3
-            box_col = (col // 3) * 3
-            for i in range(3):
-                for j in range(3):
-                    if self.grid[box_row+i][box_col+j] == num:
-                        return False
-            return True
-
-        # Define a helper function to find the next empty cell
-        def find_empty_cell():
-            for i in range(9):
-                for j in range(9):
-                    if self.grid[i][j] == None:
-                        return (i, j)
-            return None
-        
-        # Use recursion to solve the puzzle
-        def solve_helper():
-            empty_cell = find_empty_cell()
-            # If there are no empty cells, the puzzle is solved
-            if not empty_cell:
-                return True
-            row, col = empty_cell
-            # Try each possible value for the empty cell
-            for num in range(1, 10):
-                if is_valid(num, row, col):
-                    self.grid[row][col] = num
-                    # Recursively solve the puzzle with the new number in place
-                    if solve_helper():
-                        return True
-                    # If the new number leads to an unsolvable puzzle, backtrack and try a different number
-                    self.grid[row][col] = None
-            # If no valid number can be placed in the empty cell, backtrack and try a different value for the previous empty cell
-            return False
-    
-        # Call the helper function to solve the puzzle
-        solve_helper()
+        # Fill the grid with the chosen engine, an unsolvable grid is left unchanged
+        SOLVERS[self.solver](self.grid)
         # Return the solved grid
         return self.grid
+
+    # Solve the board step by step, a generator yielding the partial values (see bitmask_steps) and
+    # returning whether the board was solved. Engines without a stepper run in a process of their own,
+    # the generator yields None until they are done; closing the generator stops the process.
+    def solve_steps(self):
+        stepper = STEPPERS.get(self.solver)
+        if stepper is not None:
+            return (yield from stepper(self.grid))
+        pool = multiprocessing.Pool(1)
+        try:
+            result = pool.apply_async(_solve_grid, (self.grid, self.solver))
+            while not result.ready():
+                yield None
+            solved, grid = result.get()
+        finally:
+            pool.terminate()
+        for row, solved_row in zip(self.grid, grid):
+            row[:] = solved_row
+        return solved
     
 
-# A class representing the graphical user interface for the Sudoku game
+# Worker of SudokuGrid.solve_steps: whether `grid` was solved with `solver`, and the grid
+def _solve_grid(grid, solver):
+    solved = SOLVERS[solver](grid)
+    return solved, grid
+
+
+# Puzzles of a file in the 81 character format (digits, with 0 or . for empty cells), one per line.
+# Blank lines and lines starting with # are skipped.
+def read_puzzles(path):
+    with (sys.stdin if path == '-' else open(path)) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                if len(line) != 81:
+                    raise ValueError(f'not an 81 character puzzle: {line!r}')
+                yield line
+
+
+# Solutions of a list of puzzle lines, an unsolvable puzzle comes back unchanged
+def solve_lines(lines, solver='bitmask'):
+    solutions = []
+    for line in lines:
+        rows = [[int(c) if c != '.' else 0 for c in line[i:i + 9]] for i in range(0, 81, 9)]
+        grid = SudokuGrid(rows, solver).solve()
+        if any(value is None for row in grid for value in row):
+            solutions.append(line)
+        else:
+            solutions.append(''.join(str(value) for row in grid for value in row))
+    return solutions
+
+
+# Solve every puzzle of `source` and write the solutions to `target` in input order. Puzzles are sent to
+# the worker processes in chunks of `chunk_size`; at most `max_pending` chunks are read ahead of the
+# writer, so memory stays bounded by about max_pending * chunk_size puzzles whatever the file size.
+# Returns the number of puzzles solved and the number left unsolved.
+def solve_file(source, target='-', solver='bitmask', workers=None, chunk_size=256, max_pending=None):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+    puzzles = read_puzzles(source)
+    chunks = iter(lambda: list(itertools.islice(puzzles, chunk_size)), [])
+    solved = unsolved = 0
+    out = sys.stdout if target == '-' else open(target, 'w')
+    try:
+        def write(lines, solutions):
+            nonlocal solved, unsolved
+            for line, solution in zip(lines, solutions):
+                if solution == line and ('0' in line or '.' in line):
+                    unsolved += 1
+                else:
+                    solved += 1
+            out.write('\n'.join(solutions) + '\n')
+
+        if workers == 1:
+            for chunk in chunks:
+                write(chunk, solve_lines(chunk, solver))
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                pending = collections.deque()
+                for chunk in chunks:
+                    pending.append((chunk, executor.submit(solve_lines, chunk, solver)))
+                    # Wait for the oldest chunk before reading further, which keeps the output in order
+                    if len(pending) >= max_pending:
+                        chunk, future = pending.popleft()
+                        write(chunk, future.result())
+                while pending:
+                    chunk, future = pending.popleft()
+                    write(chunk, future.result())
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return solved, unsolved
+
+
+# A class representing the graphical user interface for the Sudoku game.
+# Solving runs as a step generator polled with after(), so the window keeps responding; the numbers are
+# canvas items created once and updated with itemconfig.
 class SudokuGUI:
-    def __init__(self, initial_numbers):
+    # Milliseconds between two polls of the solver (about 60 Hz) and the solving time spent in each
+    POLL_INTERVAL = 16
+    STEP_BUDGET = 0.008
+
+    def __init__(self, initial_numbers, solver='bitmask'):
         # Initialize a SudokuGrid object based on the provided initial numbers
-        self.grid = SudokuGrid(initial_numbers)
+        self.grid = SudokuGrid(initial_numbers, solver)
+        # Size of the board and of one cell in pixels, 40 for a 9x9 board
+        self.size = len(initial_numbers)
+        self.box = math.isqrt(self.size)
+        self.cell = 360 // self.size
+        # Generator of the running solve, None when idle
+        self.steps = None
         # Create a new window for the GUI
         self.window = tk.Tk()
         # Set the title of the window
@@ -114,67 +767,144 @@ class SudokuGUI:
         # Add the button to the window
         self.solve_button.pack()
         # Set the position of the button
-        self.solve_button.place(x=195, y=5)
+        self.solve_button.place(x=150, y=5)
+        # Create a button to stop a running solve
+        self.cancel_button = tk.Button(self.window, text="Cancel", font=("Arial", 15), state=tk.DISABLED, command=lambda: self.cancel())
+        self.cancel_button.place(x=230, y=5)
+        # Progress and result of the solve
+        self.status = tk.Label(self.window, text="", font=("Arial", 12))
+        self.status.place(x=45, y=418)
         # Start the main event loop for the GUI
         self.window.mainloop()
 
-    # Update the solved values on the grid 
+    # Start solving, the work is done in poll()
     def solve_sudoku(self):
-        # Delete any previous numbers on the canvas
-        self.canvas.delete("numbers")
-        # Check is button is clicked
-        print("Button clicked!")
-        # Call the solve method of the SudokuGrid object
-        solved_grid = self.grid.solve()
-        if solved_grid:
-            # Update the grid with the solved values
-            for i in range(9):
-                for j in range(9):
-                    value = solved_grid[i][j]
-                    if value is not None:
-                        self.canvas.create_text(2+j * 40 + 20,2+i * 40 + 20, text=str(value), font=("Arial", 20), tags="numbers")
+        if self.steps is not None:
+            return
+        self.steps = self.grid.solve_steps()
+        self.nodes = 0
+        self.solve_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.status.config(text="Solving...", fg="black")
+        self.window.after(0, self.poll)
+
+    # Run the solver for a short while, then show the progress and come back later
+    def poll(self):
+        if self.steps is None:
+            return
+        deadline = time.perf_counter() + self.STEP_BUDGET
+        values = None
+        try:
+            while time.perf_counter() < deadline:
+                values = next(self.steps)
+                # The engine runs in another process and has nothing to show yet
+                if values is None:
+                    break
+                self.nodes += 1
+        except StopIteration as done:
+            self.finish(done.value)
+            return
+        if values is None:
+            self.window.after(self.POLL_INTERVAL, self.poll)
+            return
+        # Digits of the partial solution, given as bits
+        self.show([[values[i * self.size + j].bit_length() or None for j in range(self.size)] for i in range(self.size)])
+        filled = sum(1 for value in values if value)
+        self.status.config(text=f"Solving... {self.nodes} branches, {filled}/{self.size * self.size} cells")
+        self.window.after(self.POLL_INTERVAL, self.poll)
 
+    # Show the result of a finished solve
+    def finish(self, solved):
+        self.steps = None
+        self.solve_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        if solved:
+            # Update the grid with the solved values
+            self.show(self.grid.grid)
+            self.status.config(text=f"Solved after {self.nodes} branches" if self.nodes else "Solved", fg="black")
         else:
             # Display an error message if the puzzle cannot be solved
-            error_label = tk.Label(self.window, text="Unable to solve puzzle", font=("Arial", 20), fg="red")
-            error_label.pack()
+            self.show(self.grid.grid)
+            self.status.config(text="Unable to solve puzzle", fg="red")
+
+    # Stop a running solve and go back to the initial board
+    def cancel(self):
+        if self.steps is None:
+            return
+        self.steps.close()
+        self.steps = None
+        self.show(self.grid.grid)
+        self.solve_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status.config(text="Cancelled", fg="black")
+
+    # Put the values of `grid` (None for empty) into the number items, touching only the changed ones
+    def show(self, grid):
+        for i in range(self.size):
+            for j in range(self.size):
+                text = '' if grid[i][j] is None else str(grid[i][j])
+                if self.shown[i][j] != text:
+                    self.canvas.itemconfig(self.numbers[i][j], text=text)
+                    self.shown[i][j] = text
 
-    # Draw the sudoku grid
+    # Draw the sudoku grid, every line once, and create one number item per cell
     def draw_grid(self):
-        self.canvas.create_line(2, 2, 2, 9*40)
-        self.canvas.create_line(2, 2, 9*40, 2)
+        cell = self.cell
+        end = 2 + self.size * cell
+        font = ("Arial", max(8, cell // 2))
+        self.numbers = []
+        self.shown = []
         # Iterate over each row in the grid
-        for i in range(9):
+        for i in range(self.size):
+            row, shown = [], []
             # Iterate over each cell in the row
-            for j in range(9):
-                # Calculate the coordinates of the top-left and bottom-right corners of the cell
-                x1 = 40 * j+2
-                y1 = 40 * i+2
-                x2 = x1 + 40
-                y2 = y1 + 40
-
-                # Check if cell is in the first row of a 3x3 block
-                if i % 3 == 0:
-                    # Draw a thicker black line above the block
-                    self.canvas.create_line(x1, y1, x2, y1, width=2, fill='black')
-                
-                # Check if cell is in the first column of a 3x3 block
-                if j % 3 == 0:
-                    # Draw a thicker black line to the left of the block
-                    self.canvas.create_line(x1, y1, x1, y2, width=2, fill='black')
-                
-                # Check if the cell is empty
-                if self.grid.get(i, j) is None:
-                    # If the cell is empty, draw a black rectangle around it
-                    self.canvas.create_rectangle(x1, y1, x2, y2, outline='black')
-                else:
-                    # If the cell contains a number, fill it with light gray and draw the number inside
-                    self.canvas.create_rectangle(x1, y1, x2, y2, fill='light gray', outline='black')
-                    self.canvas.create_text(x1 + 20, y1 + 20, text=str(self.grid.get(i, j)), font=("Arial", 20), tags="numbers")
-
+            for j in range(self.size):
+                # Calculate the coordinates of the top-left corner of the cell
+                x1 = cell * j + 2
+                y1 = cell * i + 2
+                value = self.grid.get(i, j)
+                # Cells with an initial number are filled with light gray
+                if value is not None:
+                    self.canvas.create_rectangle(x1, y1, x1 + cell, y1 + cell, fill='light gray', outline='')
+                text = '' if value is None else str(value)
+                row.append(self.canvas.create_text(x1 + cell // 2, y1 + cell // 2, text=text, font=font, tags="numbers"))
+                shown.append(text)
+            self.numbers.append(row)
+            self.shown.append(shown)
+        # Lines between the cells, thicker around the boxes
+        for k in range(self.size + 1):
+            width = 2 if k % self.box == 0 else 1
+            self.canvas.create_line(2 + k * cell, 2, 2 + k * cell, end, width=width, fill='black')
+            self.canvas.create_line(2, 2 + k * cell, end, 2 + k * cell, width=width, fill='black')
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sudoku solver.')
+    parser.add_argument('--solver', choices=list(SOLVERS), default='bitmask', help='solving engine (default bitmask)')
+    parser.add_argument('--bench', action='store_true', help='compare the solving engines on 9x9, 16x16 and 25x25 boards and exit')
+    parser.add_argument('--batch', metavar='FILE', help='solve every puzzle of FILE (81 characters per line, - for stdin) and exit')
+    parser.add_argument('--output', metavar='FILE', default='-', help='file for the batch solutions or generated puzzles (default stdout)')
+    parser.add_argument('--workers', type=int, help='worker processes for the batch or the generator (default all cores)')
+    parser.add_argument('--chunk-size', type=int, default=256, help='puzzles sent to a worker at once (default 256)')
+    parser.add_argument('--max-pending', type=int, help='chunks read ahead of the output, bounds the memory (default 4 per worker)')
+    parser.add_argument('--generate', type=int, metavar='COUNT', help='write COUNT puzzles with a unique solution and exit')
+    parser.add_argument('--difficulty', choices=list(DIFFICULTIES), default='medium', help='difficulty of generated puzzles (default medium)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated puzzles (default 0)')
+    args = parser.parse_args()
+    if args.generate:
+        generate_file(args.generate, args.output, args.difficulty, args.seed, args.workers)
+        raise SystemExit
+    if args.bench:
+        benchmark()
+        raise SystemExit
+    if args.batch:
+        start = time.perf_counter()
+        solved, unsolved = solve_file(args.batch, args.output, args.solver, args.workers, args.chunk_size, args.max_pending)
+        elapsed = time.perf_counter() - start
+        print(f'{solved} solved, {unsolved} unsolvable in {elapsed:.2f} s, '
+              f'{(solved + unsolved) / elapsed:.0f} puzzles/s', file=sys.stderr)
+        raise SystemExit
+
     # initial board (2 more provided in the end of the code)
     initial_numbers = [    
         [0, 7, 5, 0, 9, 0, 0, 0, 6],
@@ -188,8 +918,8 @@ if __name__ == '__main__':
         [7, 0, 0, 0, 1, 0, 3, 9, 0]
     ]
     
-    gui = SudokuGUI(initial_numbers)
-    grid = SudokuGrid(initial_numbers)
+    gui = SudokuGUI(initial_numbers, args.solver)
+    grid = SudokuGrid(initial_numbers, args.solver)
     solved_grid = grid.solve()
     print(solved_grid)
 